@@ -1,22 +1,46 @@
 import logging
+import random
 import time
 from typing import Dict, Any, List, Optional
 from utils.http_client import get_http_session
+from utils import fast_json
+from utils.etag_cache import shared_etag_cache
+from utils.rate_limiter import TokenBucket
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Upper bound for the computed 429 backoff (a server Retry-After is honoured as sent)
+MAX_BACKOFF = 30.0
+
+
+def _with_optional(params: Dict[str, Any], **optional: Any) -> Dict[str, Any]:
+    """Add the optional query parameters that were provided (not None or empty) to params"""
+    params.update({k: v for k, v in optional.items() if v is not None and v != ""})
+    return params
+
 
 class ReidinAPIClient:
-    def __init__(self):
-        self.session = get_http_session()
+    def __init__(self, pool_maxsize: int = 10, timeout: tuple[float, float] | None = None):
+        # One session (and keep-alive connection pool) shared by every caller of this client
+        self.session = get_http_session(pool_maxsize=pool_maxsize)
         self.base_url = Config.REIDIN_BASE_URL
+        self._url_prefix = f"{self.base_url}/"
+        # (connect, read) timeouts so a stalled socket fails the call instead of pinning a worker
+        self.timeout = timeout or (Config.CONNECT_TIMEOUT, Config.TIMEOUT)
+        # Paces every request (retries included) below the server's limit, so 429s stay the exception
+        self.rate_limiter = TokenBucket(rate=Config.API_RATE_LIMIT, capacity=Config.API_RATE_BURST)
+        # Open `with` blocks; the session is closed when the outermost one exits
+        self._entered = 0
 
     def __enter__(self):
+        self._entered += 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.session.close()
+        self._entered -= 1
+        if self._entered == 0:
+            self.session.close()
 
     def get(
         self,
@@ -24,25 +48,48 @@ class ReidinAPIClient:
         params: Dict[str, Any] | None = None,
         max_retries: int = 3,
         retry_delay: float = 2.0,
+        conditional: bool = False,
     ) -> Dict[str, Any]:
-        url = f"{self.base_url}/{endpoint}"
-        logger.info("Fetching data from %s with params %s", url, params)
+        url = self._url_prefix + endpoint
+        logger.info("GET %s %s", url, params)
+
+        # Revalidate a cached body instead of downloading it again (when the cache is enabled;
+        # all clients share one shelf per process, opened by the first conditional GET)
+        cache = shared_etag_cache(Config.ETAG_CACHE_PATH) if conditional and Config.ETAG_CACHE_PATH else None
+        cached = None
+        if cache:
+            cache_key = f"{url}?{sorted(params.items())}" if params else url
+            cached = cache.get(cache_key)
+        headers = None
+        if cached:
+            headers = {}
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
 
         for attempt in range(max_retries + 1):
+            response = None
             try:
-                response = self.session.get(url, params=params, timeout=Config.TIMEOUT)
+                self.rate_limiter.acquire()
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
                 response.raise_for_status()
-                logger.info("API response: %s", response)
-                data = response.json()
+                if cached and response.status_code == 304:
+                    return fast_json.loads(cached.content)
+                # Decode the raw bytes directly (orjson when installed)
+                data = fast_json.loads(response.content)
+                if cache:
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    if etag or last_modified:
+                        cache.put(cache_key, etag, last_modified, response.content)
                 return data
             except Exception as e:
                 # Check if it's a 429 (rate limit) error
-                if "response" in locals() and hasattr(response, "status_code"):
+                if response is not None:
                     if response.status_code == 429:
                         if attempt < max_retries:
-                            wait_time = retry_delay * (
-                                2**attempt
-                            )  # Exponential backoff
+                            wait_time = self._retry_wait(response, attempt, retry_delay)
                             logger.warning(
                                 "Rate limit hit (429), retrying in %.1f seconds (attempt %d/%d)",
                                 wait_time,
@@ -63,6 +110,18 @@ class ReidinAPIClient:
                 logger.error("API request failed: %s", e)
                 raise
 
+    @staticmethod
+    def _retry_wait(response, attempt: int, retry_delay: float) -> float:
+        """Seconds to wait before retrying a 429 response"""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass  # an HTTP date; fall back to backoff
+        # Jitter keeps parallel workers from retrying in lockstep and re-triggering the limit
+        return min(MAX_BACKOFF, retry_delay * (2**attempt) * (1 + random.random() * 0.5))
+
     def get_locations(
         self, country_code: str, limit: int | None = None, offset: int | None = None
     ) -> Dict[str, Any]:
@@ -71,13 +130,12 @@ class ReidinAPIClient:
         if limit is None and offset is not None:
             limit = Config.BATCH_SIZE
         params = {"page_size": limit, "scroll_id": offset} if offset != None else None
-        logger.info("Fetching locations data from %s with params %s", endpoint, params)
         return self.get(endpoint, params)
 
     def get_property_location(self, location_id: str) -> Dict[str, Any]:
         """Get property location data from Reidin API"""
         endpoint = Config.PROPERTY_LOCATION_ENDPOINT.format(location_id=location_id)
-        return self.get(endpoint)
+        return self.get(endpoint, conditional=True)
 
     def get_property_details(self, property_id: str) -> Dict[str, Any]:
         """Get property details data from Reidin API"""
@@ -85,22 +143,26 @@ class ReidinAPIClient:
         return self.get(endpoint)
 
     def get_indicators_aliases(
-        self, country_code: str, params: Dict[str, Any] = Config.DEFAULT_PARAMS
+        self, country_code: str, params: Dict[str, Any] | None = None
     ) -> Dict[str, Any]:
         """Get indicators aliases data from Reidin API"""
         endpoint = Config.INDICATORS_ALIASES_ENDPOINT.format(country_code=country_code)
+        if params is None:
+            params = dict(Config.DEFAULT_PARAMS)
 
         return self.get(endpoint, params)
 
     def get_indicators_area_aliases(
         self,
         country_code: str,
-        params: Dict[str, Any] = Config.DEFAULT_PARAMS,
+        params: Dict[str, Any] | None = None,
     ) -> Dict[str, Any]:
         """Get indicators area aliases data from Reidin API"""
         endpoint = Config.INDICATORS_AREA_ALIASES_ENDPOINT.format(
             country_code=country_code
         )
+        if params is None:
+            params = dict(Config.DEFAULT_PARAMS)
 
         return self.get(endpoint, params)
 
@@ -122,28 +184,22 @@ class ReidinAPIClient:
         """Fetch CMA sales data from Reidin API"""
         endpoint = Config.CMA_SALES_ENDPOINT.format(country_code=country_code)
 
-        params = {
-            "alias": alias,
-            "currency": currency,
-            "measurement": measurement,
-            "property_type": property_type,
-            "property_subtype": property_subtype,
-            "property_id": property_id,
-        }
+        params = _with_optional(
+            {
+                "alias": alias,
+                "currency": currency,
+                "measurement": measurement,
+                "property_type": property_type,
+                "property_subtype": property_subtype,
+                "property_id": property_id,
+            },
+            no_of_bedrooms=no_of_bedrooms,
+            size=size,
+            sales_activity_type=sales_activity_type,
+            lat=lat,
+            lon=lon,
+        )
 
-        # Add optional parameters if provided
-        if no_of_bedrooms is not None:
-            params["no_of_bedrooms"] = no_of_bedrooms
-        if size:
-            params["size"] = size
-        if sales_activity_type:
-            params["sales_activity_type"] = sales_activity_type
-        if lat:
-            params["lat"] = lat
-        if lon:
-            params["lon"] = lon
-
-        logger.info("Fetching CMA sales data from %s with params %s", endpoint, params)
         return self.get(endpoint, params)
 
     def fetch_transactions_price(
@@ -159,23 +215,17 @@ class ReidinAPIClient:
         """Fetch transactions price data from Reidin API"""
         endpoint = Config.TRANSACTIONS_PRICE_ENDPOINT.format(country_code=country_code)
 
-        params = {
-            "location_id": location_id,
-            "property_type": property_type,
-            "activity_type": activity_type,
-        }
-
-        # Add optional parameters if provided
-        if property_id is not None:
-            params["property_id"] = property_id
-        if property_sub_type:
-            params["property_sub_type"] = property_sub_type
-        if no_of_bedrooms is not None:
-            params["no_of_bedrooms"] = no_of_bedrooms
-
-        logger.info(
-            "Fetching transactions price data from %s with params %s", endpoint, params
+        params = _with_optional(
+            {
+                "location_id": location_id,
+                "property_type": property_type,
+                "activity_type": activity_type,
+            },
+            property_id=property_id,
+            property_sub_type=property_sub_type,
+            no_of_bedrooms=no_of_bedrooms,
         )
+
         return self.get(endpoint, params)
 
     def fetch_transaction_raw_sales(
@@ -185,11 +235,6 @@ class ReidinAPIClient:
         endpoint = Config.TRANSACTION_RAW_SALES_ENDPOINT.format(
             country_code=country_code
         )
-        logger.info(
-            "Fetching transaction raw sales data from %s with params %s",
-            endpoint,
-            params,
-        )
         return self.get(endpoint, params)
 
     def fetch_transaction_raw_rents(
@@ -199,11 +244,6 @@ class ReidinAPIClient:
         endpoint = Config.TRANSACTION_RAW_RENTS_ENDPOINT.format(
             country_code=country_code
         )
-        logger.info(
-            "Fetching transaction raw rents data from %s with params %s",
-            endpoint,
-            params,
-        )
         return self.get(endpoint, params)
 
     def fetch_transaction_history(
@@ -211,9 +251,6 @@ class ReidinAPIClient:
     ) -> Dict[str, Any]:
         """Fetch transaction history data from Reidin API"""
         endpoint = Config.TRANSACTION_HISTORY_ENDPOINT.format(country_code=country_code)
-        logger.info(
-            "Fetching transaction history data from %s with params %s", endpoint, params
-        )
         return self.get(endpoint, params)
 
     def fetch_transactions_avg(
@@ -221,16 +258,10 @@ class ReidinAPIClient:
     ) -> Dict[str, Any]:
         """Fetch transactions average data from Reidin API"""
         endpoint = Config.TRANSACTIONS_AVG_ENDPOINT.format(country_code=country_code)
-        logger.info(
-            "Fetching transactions average data from %s with params %s",
-            endpoint,
-            params,
-        )
         return self.get(endpoint, params)
 
     def fetch_companies_from_properties(self, location_id: str) -> Dict[str, Any]:
         """Fetch companies data via property location from Reidin API"""
-        logger.info("Fetching companies data for location %s", location_id)
         return self.get_property_location(location_id)
 
     def fetch_transactions_list(
@@ -253,9 +284,6 @@ class ReidinAPIClient:
             "measurement": measurement,
         }
 
-        logger.info(
-            "Fetching transactions list data from %s with params %s", endpoint, params
-        )
         return self.get(endpoint, params)
 
     def fetch_poi_cma(
@@ -271,19 +299,16 @@ class ReidinAPIClient:
         """Fetch POI CMA data from Reidin API with retry logic for rate limiting"""
         endpoint = Config.POI_CMA_ENDPOINT
 
-        params = {
-            "property_id": property_id,
-            "measurement": measurement,
-            "lang": lang,
-        }
-
-        # Add optional parameters if provided
-        if lat:
-            params["lat"] = lat
-        if lon:
-            params["lon"] = lon
+        params = _with_optional(
+            {
+                "property_id": property_id,
+                "measurement": measurement,
+                "lang": lang,
+            },
+            lat=lat,
+            lon=lon,
+        )
 
-        logger.info("Fetching POI CMA data from %s with params %s", endpoint, params)
         return self.get(
             endpoint, params, max_retries=max_retries, retry_delay=retry_delay
         )
@@ -315,7 +340,6 @@ class ReidinAPIClient:
         if property_id:
             params["property_id"] = property_id
 
-        logger.info("Fetching CMA2-rents data from %s with params %s", endpoint, params)
         return self.get(
             endpoint, params, max_retries=max_retries, retry_delay=retry_delay
         )
@@ -330,7 +354,6 @@ class ReidinAPIClient:
         # Remove country_code from params as it's used in endpoint
         api_params = {k: v for k, v in params.items() if k != "country_code"}
 
-        logger.info("Fetching CMA data from %s with params %s", endpoint, api_params)
         return self.get(
             endpoint, api_params, max_retries=max_retries, retry_delay=retry_delay
         )
@@ -1,4 +1,5 @@
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,18 +36,28 @@ class Config:
     CMA2_RENTS_ENDPOINT = '{country_code}/transactions/cma2-rents/'
 
     # Request settings
-    TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))
+    TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))  # read timeout
+    CONNECT_TIMEOUT = float(os.getenv("REQUEST_CONNECT_TIMEOUT", 5))
     RETRIES = int(os.getenv("REQUEST_RETRIES", 3))
+    # Client-wide cap on API requests per second (0 disables it; importers also pace themselves)
+    API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", 0))
+    API_RATE_BURST = int(os.getenv("API_RATE_BURST", 1))
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1000))
     DATABASE_BATCH_SIZE = int(os.getenv("DATABASE_BATCH_SIZE", 5000))
     INDICATORS_BATCH_SIZE = int(os.getenv("INDICATORS_BATCH_SIZE", 10))
+    # Keep the full API item in CMA raw_data columns (debugging/lineage only, ~10x row size)
+    CMA_STORE_RAW = os.getenv("CMA_STORE_RAW", "0") == "1"
+    # Shelf file for conditional-GET (ETag / Last-Modified) caching of property location
+    # responses across runs; unset disables it
+    ETAG_CACHE_PATH = os.getenv("ETAG_CACHE_PATH") or None
     
-    DEFAULT_PARAMS = {
+    # Read-only: used as a default by several functions, so a caller's mutation would leak into later calls
+    DEFAULT_PARAMS = MappingProxyType({
         "currency": "aed",
         "measurement": "int",
         "alias": "sales-price",
         "property_type": "residential-general",
-    }
+    })
 
     @classmethod
     def get_api_headers(cls) -> dict:
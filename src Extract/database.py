@@ -4,18 +4,25 @@ import json
 import threading
 import time
 
+from contextlib import contextmanager
 from psycopg2.extras import execute_values
 from psycopg2 import pool
-from typing import List, Dict, Any, Optional, Set
+from typing import Iterator, List, Dict, Any, Optional, Sequence
 from config import Config
+from utils import fast_json
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, synchronous_commit: bool = True):
         # Initialize connection pool for better performance
         self._pool = None
         self._pool_lock = threading.Lock()
+        # CMA upsert SQL per dynamic schema version (table/indexes already ensured)
+        self._cma_insert_queries = {}
+        # Importers of idempotent upserts turn this off: commits then return before the WAL is
+        # flushed to disk. A server crash can lose the last few commits, which a re-run re-imports.
+        self.synchronous_commit = synchronous_commit
     
     def _get_pool(self):
         """Get or create connection pool (thread-safe)"""
@@ -72,6 +79,26 @@ class DatabaseManager:
                         options='-c statement_timeout=30000'
                     )
     
+    @contextmanager
+    def pooled_connection(self):
+        """Borrow a pooled connection: commit on success, roll back on error, always return it to the pool
+        
+        Unlike `with conn:` on a raw psycopg2 connection, which only ends the transaction,
+        this hands the connection back to the pool so it is reused instead of leaked.
+        """
+        conn = self.get_connection()
+        try:
+            if not self.synchronous_commit:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL synchronous_commit TO OFF")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
     def return_connection(self, conn):
         """Return connection to pool with proper error handling"""
         try:
@@ -109,7 +136,7 @@ class DatabaseManager:
 
     def bulk_insert(self, query: str, data_list: List[Dict[str, Any]]) -> None:
         """Generic bulk insert method with error handling"""
-        with self.get_connection() as conn, conn.cursor() as cur:
+        with self.pooled_connection() as conn, conn.cursor() as cur:
             try:
                 values = [tuple(d.values()) for d in data_list]
                 logger.info("Values: %s", values[0])
@@ -292,7 +319,7 @@ class DatabaseManager:
         if limit:
             query += " LIMIT %s"
             params.append(str(limit))
-        with self.get_connection() as conn, conn.cursor() as cur:
+        with self.pooled_connection() as conn, conn.cursor() as cur:
             cur.execute(query, params)
             columns = [desc[0] for desc in cur.description]
             return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -313,7 +340,103 @@ class DatabaseManager:
         if limit:
             query += " LIMIT %s"
             params.append(str(limit))
-        with self.get_connection() as conn, conn.cursor() as cur:
+        with self.pooled_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def _iter_keyset(
+        self,
+        select: str,
+        key: str,
+        conditions: List[str],
+        params: List[Any],
+        limit: int | None = None,
+        page_size: int = 1000,
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream a query's rows in key order, one short transaction per page of page_size rows
+        
+        Pages are read with `key > <last key> ORDER BY key LIMIT page_size` (keyset paging),
+        so no connection or read transaction stays open between pages or while the caller
+        works through them. select must include the key column.
+        """
+        last_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            where = list(conditions)
+            page_params = list(params)
+            if last_key is not None:
+                where.append(f"{key} > %s")
+                page_params.append(last_key)
+            query = select
+            if where:
+                query += " WHERE " + " AND ".join(where)
+            query += f" ORDER BY {key} LIMIT %s"
+            page_params.append(size)
+
+            with self.pooled_connection() as conn, conn.cursor() as cur:
+                cur.execute(query, page_params)
+                columns = [desc[0] for desc in cur.description]
+                rows = cur.fetchall()
+
+            for row in rows:
+                yield dict(zip(columns, row))
+            if len(rows) < size:
+                return
+            last_key = rows[-1][columns.index(key)]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def iter_locations(
+        self, country_code: str | None = None, limit: int | None = None, page_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream locations ordered by location_id with optional country code filter"""
+        conditions = []
+        params = []
+        if country_code:
+            conditions.append("country_code = %s")
+            params.append(country_code)
+        yield from self._iter_keyset(
+            "SELECT location_id FROM location", "location_id", conditions, params, limit, page_size
+        )
+
+    def iter_properties(self, limit: int | None = None, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Stream property ids ordered by id"""
+        yield from self._iter_keyset("SELECT id FROM property", "id", [], [], limit, page_size)
+
+    def get_unprocessed_properties_after(
+        self,
+        alias: str,
+        currency: str,
+        measurement: str,
+        property_types: List[str],
+        last_id: int = 0,
+        limit: int | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Retrieve properties with id > last_id that have no CMA sales rows yet for the given parameters
+        
+        The anti-join runs server-side and is served by the leading columns of the
+        cma_sales unique index (property_id, alias, currency, measurement, property_type, ...).
+        """
+        query = """
+        SELECT p.id FROM property p
+        WHERE p.id > %s
+        AND NOT EXISTS (
+            SELECT 1 FROM cma_sales c
+            WHERE c.property_id = p.id
+            AND c.alias = %s
+            AND c.currency = %s
+            AND c.measurement = %s
+            AND c.property_type = ANY(%s)
+        )
+        ORDER BY p.id
+        """
+        params = [last_id, alias, currency, measurement, list(property_types)]
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        with self.pooled_connection() as conn, conn.cursor() as cur:
             cur.execute(query, params)
             columns = [desc[0] for desc in cur.description]
             return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -328,7 +451,7 @@ class DatabaseManager:
         if limit:
             query += " LIMIT %s"
             params.append(str(limit))
-        with self.get_connection() as conn, conn.cursor() as cur:
+        with self.pooled_connection() as conn, conn.cursor() as cur:
             cur.execute(query, params)
             columns = [desc[0] for desc in cur.description]
             return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -336,7 +459,7 @@ class DatabaseManager:
     def get_property_details(self, property_id: int) -> Dict[str, Any] | None:
         """Retrieve detailed property information"""
         query = "SELECT * FROM property_details WHERE property_id = %s"
-        with self.get_connection() as conn, conn.cursor() as cur:
+        with self.pooled_connection() as conn, conn.cursor() as cur:
             cur.execute(query, (property_id,))
             columns = [desc[0] for desc in cur.description]
             row = cur.fetchone()
@@ -371,36 +494,33 @@ class DatabaseManager:
         """
         
         try:
-            # Ensure data is in the correct order for bulk insert
+            # Ensure data is in the correct order for bulk insert. A multi-row upsert can't
+            # touch the same row twice, so keep only the last record per conflict key
+            # (the same outcome as upserting the records one after another).
+            columns = (
+                'location_id', 'location_name', 'property_type', 'activity_type',
+                'currency', 'measurement', 'no_of_bedrooms', 'date_period',
+                'year', 'month', 'average_net_price', 'average_unit_price',
+                'total_count', 'total_price', 'price_per_sqm', 'transaction_volume', 'raw_data',
+            )
             ordered_data = []
+            key_positions = {}
             for record in data_list:
-                ordered_record = [
-                    record.get('location_id'),
-                    record.get('location_name'),
-                    record.get('property_type'),
-                    record.get('activity_type'),
-                    record.get('currency'),
-                    record.get('measurement'),
-                    record.get('no_of_bedrooms'),
-                    record.get('date_period'),
-                    record.get('year'),
-                    record.get('month'),
-                    record.get('average_net_price'),
-                    record.get('average_unit_price'),
-                    record.get('total_count'),
-                    record.get('total_price'),
-                    record.get('price_per_sqm'),
-                    record.get('transaction_volume'),
-                    record.get('raw_data')
-                ]
-                ordered_data.append(ordered_record)
+                ordered_record = tuple(map(record.get, columns))
+                conflict_key = (ordered_record[0], *ordered_record[2:8])
+                if None in conflict_key:
+                    # NULLs never conflict: the UNIQUE constraint treats them as distinct
+                    ordered_data.append(ordered_record)
+                elif conflict_key in key_positions:
+                    ordered_data[key_positions[conflict_key]] = ordered_record
+                else:
+                    key_positions[conflict_key] = len(ordered_data)
+                    ordered_data.append(ordered_record)
             
-            # Use execute_values directly for better control
-            with self.get_connection() as conn, conn.cursor() as cur:
-                from psycopg2.extras import execute_values
-                execute_values(cur, insert_query, ordered_data)
-                conn.commit()
-                logger.info(f"Successfully inserted/updated {len(data_list)} transactions average records")
+            # One multi-row VALUES statement per batch instead of execute_values' default 100-row pages
+            with self.pooled_connection() as conn, conn.cursor() as cur:
+                execute_values(cur, insert_query, ordered_data, page_size=len(ordered_data))
+            logger.info(f"Successfully inserted/updated {len(ordered_data)} transactions average records")
         except Exception as e:
             logger.error(f"Failed to insert transactions average data: {e}")
             raise
@@ -488,7 +608,7 @@ class DatabaseManager:
                 ordered_data.append(ordered_record)
             
             # Use execute_values directly for better control
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 from psycopg2.extras import execute_values
                 execute_values(cur, insert_query, ordered_data)
                 conn.commit()
@@ -535,7 +655,7 @@ class DatabaseManager:
         import json
         
         try:
-            with self.get_connection() as conn:
+            with self.pooled_connection() as conn:
                 with conn.cursor() as cursor:
                     # Create a StringIO buffer for COPY
                     output = io.StringIO()
@@ -610,7 +730,7 @@ class DatabaseManager:
             values_list.append(values)
         
         # Execute the insert with ON CONFLICT handling
-        with self.get_connection() as conn:
+        with self.pooled_connection() as conn:
             with conn.cursor() as cursor:
                 execute_values(cursor, insert_query, values_list)
                 conn.commit()
@@ -689,7 +809,7 @@ class DatabaseManager:
                 ordered_data.append(ordered_record)
             
             # Use execute_values directly for better control
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 from psycopg2.extras import execute_values
                 execute_values(cur, insert_query, ordered_data)
                 conn.commit()
@@ -698,8 +818,12 @@ class DatabaseManager:
             logger.error(f"Failed to insert transaction sales data: {e}")
             raise
 
-    def insert_cma_sales_data(self, data_list: List[Dict[str, Any]]) -> None:
-        """Insert CMA sales data into the database with proper schema and ON CONFLICT handling"""
+    def insert_cma_sales_data(self, data_list: List[Sequence[Any]]) -> None:
+        """Insert CMA sales data into the database with proper schema and ON CONFLICT handling
+        
+        Records are tuples in cma_sales column order (see processors.CMASalesRecord), so they
+        go to execute_values / COPY without per-record dict lookups.
+        """
         if not data_list:
             logger.info("No CMA sales data to insert")
             return
@@ -721,117 +845,86 @@ class DatabaseManager:
                 DO NOTHING
             """
             
-            # Prepare ordered data for execute_values with proper JSON handling
-            from psycopg2.extras import Json
-            ordered_data = []
-            for record in data_list:
-                ordered_record = [
-                    record.get('property_id'),
-                    record.get('alias'),
-                    record.get('currency'),
-                    record.get('measurement'),
-                    record.get('property_type'),
-                    record.get('property_subtype'),
-                    record.get('comparable_property_id'),
-                    record.get('comparable_property_name'),
-                    record.get('size'),
-                    record.get('price'),
-                    record.get('price_per_size'),
-                    record.get('transaction_date'),
-                    record.get('city_id'),
-                    record.get('city_name'),
-                    record.get('county_id'),
-                    record.get('county_name'),
-                    record.get('district_id'),
-                    record.get('district_name'),
-                    record.get('location_id'),
-                    record.get('location_name'),
-                    record.get('municipal_area'),
-                    record.get('activity_type'),
-                    record.get('no_of_bedrooms'),
-                    record.get('number_of_unit'),
-                    record.get('property_nature'),
-                    record.get('number_of_floors'),
-                    Json(record.get('parent_property')) if record.get('parent_property') else None,
-                    Json(record.get('raw_data')) if record.get('raw_data') else None
-                ]
-                ordered_data.append(ordered_record)
-            
             # Use COPY for maximum performance with large batches
-            if len(ordered_data) >= 5000:  # Use COPY for batches >=5k (always faster for bulk)
-                self._bulk_insert_with_copy(ordered_data)
+            if len(data_list) >= 5000:  # Use COPY for batches >=5k (always faster for bulk)
+                self._bulk_insert_with_copy(data_list)
             else:  # Use execute_values for smaller batches
-                conn = None
-                try:
-                    conn = self.get_connection()
-                    with conn.cursor() as cur:
-                        from psycopg2.extras import execute_values, Json
-                        execute_values(cur, insert_query, ordered_data, page_size=1000)
-                        conn.commit()
-                finally:
-                    if conn:
-                        self.return_connection(conn)
-                
-                end_time = time.time()
-                duration = end_time - start_time
-                logger.info(f"✅ Successfully inserted {len(data_list)} CMA sales records in {duration:.2f} seconds")
+                # Only the trailing JSONB columns (parent_property, raw_data) need adapting
+                from psycopg2.extras import Json
+                ordered_data = [
+                    (*record[:26],
+                     Json(record[26], dumps=fast_json.dumps) if record[26] else None,
+                     Json(record[27], dumps=fast_json.dumps) if record[27] else None)
+                    for record in data_list
+                ]
+                from psycopg2.extras import execute_values
+                # One multi-row VALUES statement for the whole batch; rolled back before the
+                # connection goes back to the pool if it fails
+                with self.pooled_connection() as conn, conn.cursor() as cur:
+                    execute_values(cur, insert_query, ordered_data, page_size=len(ordered_data))
+            
+            end_time = time.time()
+            duration = end_time - start_time
+            logger.info(f"✅ Successfully inserted {len(data_list)} CMA sales records in {duration:.2f} seconds")
         except Exception as e:
             logger.error(f"Failed to insert CMA sales data: {e}")
             raise
 
     def _bulk_insert_with_copy(self, ordered_data):
-        """Ultra-fast bulk insert using PostgreSQL COPY for large batches"""
+        """Ultra-fast bulk insert using PostgreSQL COPY for large batches
+        
+        Rows are streamed as CSV into a temporary staging table and moved into
+        cma_sales with ON CONFLICT DO NOTHING, so duplicates behave exactly like
+        the execute_values path.
+        """
+        import csv
         import io
-        import json
+        
+        columns = [
+            'property_id', 'alias', 'currency', 'measurement', 'property_type', 'property_subtype',
+            'comparable_property_id', 'comparable_property_name', 'size', 'price', 'price_per_size',
+            'transaction_date', 'city_id', 'city_name', 'county_id', 'county_name', 'district_id',
+            'district_name', 'location_id', 'location_name', 'municipal_area', 'activity_type',
+            'no_of_bedrooms', 'number_of_unit', 'property_nature', 'number_of_floors',
+            'parent_property', 'raw_data'
+        ]
+        columns_str = ", ".join(columns)
+        
+        # Render the batch as CSV; the csv module takes care of quoting/escaping
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in ordered_data:
+            writer.writerow([
+                '\\N' if value is None
+                else fast_json.dumps(value) if isinstance(value, (dict, list))
+                else value
+                for value in row
+            ])
+        buffer.seek(0)
         
         conn = None
         try:
             conn = self.get_connection()
             with conn.cursor() as cur:
-                # Create a StringIO buffer for COPY
-                buffer = io.StringIO()
-                
-                for row in ordered_data:
-                    # Convert row to tab-separated values
-                    # Handle None values and JSON fields
-                    formatted_row = []
-                    for i, value in enumerate(row):
-                        if value is None:
-                            formatted_row.append('\\N')  # PostgreSQL NULL representation
-                        elif i in [26, 27]:  # parent_property and raw_data columns (JSON)
-                            # Convert JSON objects to strings
-                            if isinstance(value, dict):
-                                formatted_row.append(json.dumps(value).replace('\t', ' ').replace('\n', ' '))
-                            else:
-                                formatted_row.append(str(value).replace('\t', ' ').replace('\n', ' '))
-                        else:
-                            formatted_row.append(str(value).replace('\t', ' ').replace('\n', ' '))
-                    
-                    buffer.write('\t'.join(formatted_row) + '\n')
-                
-                buffer.seek(0)
-                
-                # Use COPY for ultra-fast bulk insert
-                cur.copy_from(
-                    buffer,
-                    'cma_sales',
-                    columns=[
-                        'property_id', 'alias', 'currency', 'measurement', 'property_type', 'property_subtype',
-                        'comparable_property_id', 'comparable_property_name', 'size', 'price', 'price_per_size',
-                        'transaction_date', 'city_id', 'city_name', 'county_id', 'county_name', 'district_id',
-                        'district_name', 'location_id', 'location_name', 'municipal_area', 'activity_type',
-                        'no_of_bedrooms', 'number_of_unit', 'property_nature', 'number_of_floors',
-                        'parent_property', 'raw_data'
-                    ],
-                    sep='\t',
-                    null='\\N'
+                cur.execute("CREATE TEMP TABLE IF NOT EXISTS cma_sales_staging (LIKE cma_sales INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+                cur.copy_expert(
+                    f"COPY cma_sales_staging ({columns_str}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
                 )
+                cur.execute(f"""
+                    INSERT INTO cma_sales ({columns_str})
+                    SELECT {columns_str} FROM cma_sales_staging
+                    ON CONFLICT (property_id, alias, currency, measurement, property_type, property_subtype, comparable_property_id)
+                    DO NOTHING
+                """)
                 conn.commit()
                 
                 logger.info(f"🚀 Ultra-fast COPY insert completed for {len(ordered_data)} records")
                 
         except Exception as e:
             logger.error(f"❌ Failed COPY bulk insert: {e}")
+            if conn:
+                conn.rollback()
             raise
         finally:
             if conn:
@@ -875,7 +968,7 @@ class DatabaseManager:
                 ordered_data.append(ordered_record)
             
             # Use execute_values directly for better control
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 from psycopg2.extras import execute_values
                 execute_values(cur, insert_query, ordered_data)
                 conn.commit()
@@ -976,7 +1069,7 @@ class DatabaseManager:
                 ordered_data.append(ordered_record)
             
             # Use execute_values directly for better control
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 from psycopg2.extras import execute_values
                 execute_values(cur, insert_query, ordered_data)
                 conn.commit()
@@ -1031,7 +1124,7 @@ class DatabaseManager:
     #     """
         
     #     try:
-    #         with self.get_connection() as conn, conn.cursor() as cur:
+    #         with self.pooled_connection() as conn, conn.cursor() as cur:
     #             cur.execute(create_table_query)
     #             conn.commit()
     #             logger.info("Transaction list table created successfully")
@@ -1042,7 +1135,7 @@ class DatabaseManager:
     def get_transaction_raw_rent_count(self) -> int:
         """Get the total count of records in transaction_raw_rent table"""
         try:
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 cur.execute("SELECT COUNT(*) FROM transaction_raw_rent")
                 return cur.fetchone()[0]
         except Exception as e:
@@ -1052,7 +1145,7 @@ class DatabaseManager:
     def get_duplicate_count(self) -> int:
         """Get the count of duplicate records in transaction_raw_rent table"""
         try:
-            with self.get_connection() as conn, conn.cursor() as cur:
+            with self.pooled_connection() as conn, conn.cursor() as cur:
                 # Count records that have duplicates based on the unique constraint
                 cur.execute("""
                     SELECT COUNT(*) - COUNT(DISTINCT (location_id, currency, measurement, date, price, size))
@@ -1231,7 +1324,7 @@ class DatabaseManager:
     #     """
         
     #     try:
-    #         with self.get_connection() as conn, conn.cursor() as cur:
+    #         with self.pooled_connection() as conn, conn.cursor() as cur:
     #             cur.execute(create_table_query)
     #             conn.commit()
     #             logger.info("Transaction raw rent table created/verified successfully")
@@ -1239,44 +1332,48 @@ class DatabaseManager:
     #         logger.error(f"Failed to create transaction raw rent table: {e}")
     #         raise
 
-    def insert_cma_data_dynamic(self, data_list: List[Dict[str, Any]], discovered_columns: Set[str]) -> None:
-        """Insert CMA data with dynamic schema handling"""
-        if not data_list:
+    def insert_cma_data_dynamic(self, column_data: Dict[str, List[Any]], discovered_columns: Sequence[str],
+                                commit: bool = True, schema_version: Optional[int] = None) -> None:
+        """Insert column-oriented CMA data (column name -> list of values) with dynamic schema handling
+        
+        When schema_version is given, the table DDL and upsert SQL are built once per
+        version and reused by later batches. commit=False rolls the insert back, which
+        is used for timing probes.
+        """
+        row_count = len(next(iter(column_data.values()), []))
+        if not row_count:
             return
             
         try:
             start_time = time.time()
-            logger.info(f"Starting batch insert of {len(data_list)} CMA records with dynamic schema...")
-            
-            # Create table if it doesn't exist with dynamic columns
-            self._create_cma_table_dynamic(discovered_columns, data_list)
+            logger.info(f"Starting batch insert of {row_count} CMA records with dynamic schema...")
             
-            # Prepare data for insertion
-            ordered_data = []
-            for record in data_list:
-                # Ensure all discovered columns are present in the record
-                ordered_record = []
-                for column in discovered_columns:
-                    value = record.get(column)
-                    if value is None:
-                        ordered_record.append(None)
-                    elif isinstance(value, (dict, list)):
-                        ordered_record.append(Json(value))
-                    else:
-                        ordered_record.append(value)
-                ordered_data.append(tuple(ordered_record))
+            insert_query = self._cma_insert_queries.get(schema_version) if schema_version is not None else None
+            if insert_query is None:
+                # Create table if it doesn't exist with dynamic columns
+                self._create_cma_table_dynamic(discovered_columns, column_data)
+                
+                # Build dynamic insert query
+                columns_str = ', '.join([f'"{col}"' for col in discovered_columns])
+                insert_query = f"""
+                    INSERT INTO cma_data ({columns_str})
+                    VALUES %s
+                    ON CONFLICT (property_id, alias, currency, measurement, property_type, activity_type) 
+                    DO UPDATE SET
+                        {', '.join([f'"{col}" = EXCLUDED."{col}"' for col in discovered_columns if col not in ['property_id', 'alias', 'currency', 'measurement', 'property_type', 'activity_type']])},
+                        updated_at = CURRENT_TIMESTAMP
+                """
+                if schema_version is not None:
+                    self._cma_insert_queries[schema_version] = insert_query
             
-            # Build dynamic insert query
-            columns_str = ', '.join([f'"{col}"' for col in discovered_columns])
-            placeholders = ', '.join(['%s'] * len(discovered_columns))
-            insert_query = f"""
-                INSERT INTO cma_data ({columns_str})
-                VALUES %s
-                ON CONFLICT (property_id, alias, currency, measurement, property_type, activity_type) 
-                DO UPDATE SET
-                    {', '.join([f'"{col}" = EXCLUDED."{col}"' for col in discovered_columns if col not in ['property_id', 'alias', 'currency', 'measurement', 'property_type', 'activity_type']])},
-                    updated_at = CURRENT_TIMESTAMP
-            """
+            # Zip the column arrays into row tuples; columns absent from this batch are NULL
+            from psycopg2.extras import Json
+            missing = [None] * row_count
+            column_arrays = [column_data.get(column, missing) for column in discovered_columns]
+            ordered_data = [
+                tuple(Json(value) if isinstance(value, (dict, list)) else value for value in row)
+                for row in zip(*column_arrays)
+            ]
             
             # Use execute_values for insertion
             conn = None
@@ -1284,20 +1381,24 @@ class DatabaseManager:
                 conn = self.get_connection()
                 with conn.cursor() as cur:
                     from psycopg2.extras import execute_values
-                    execute_values(cur, insert_query, ordered_data, page_size=1000)
-                    conn.commit()
+                    # One multi-row VALUES statement for the whole batch
+                    execute_values(cur, insert_query, ordered_data, page_size=len(ordered_data))
+                    if commit:
+                        conn.commit()
+                    else:
+                        conn.rollback()
             finally:
                 if conn:
                     self.return_connection(conn)
             
             end_time = time.time()
             duration = end_time - start_time
-            logger.info(f"✅ Successfully inserted {len(data_list)} CMA records in {duration:.2f} seconds")
+            logger.info(f"✅ Successfully inserted {row_count} CMA records in {duration:.2f} seconds")
         except Exception as e:
             logger.error(f"Failed to insert CMA data: {e}")
             raise
 
-    def _create_cma_table_dynamic(self, discovered_columns: Set[str], sample_data: List[Dict[str, Any]] = None) -> None:
+    def _create_cma_table_dynamic(self, discovered_columns: Sequence[str], sample_data: Dict[str, List[Any]] = None) -> None:
         """Create CMA table with dynamic columns and proper data types"""
         try:
             # Start with base columns
@@ -1320,7 +1421,7 @@ class DatabaseManager:
             for column in discovered_columns:
                 if column not in ['property_id', 'alias', 'currency', 'measurement', 'property_type', 'activity_type', 'raw_data', 'processed_at', 'import_batch_id']:
                     # Determine column type based on sample data
-                    column_type = self._determine_column_type(column, sample_data)
+                    column_type = self._determine_column_type(column, sample_data.get(column) if sample_data else None)
                     base_columns.append(f'"{column}" {column_type}')
             
             # Create table
@@ -1355,16 +1456,13 @@ class DatabaseManager:
             logger.error(f"Failed to create CMA data table: {e}")
             raise
 
-    def _determine_column_type(self, column_name: str, sample_data: List[Dict[str, Any]] = None) -> str:
-        """Determine the appropriate PostgreSQL data type for a column based on sample data"""
-        if not sample_data:
+    def _determine_column_type(self, column_name: str, sample_values: List[Any] = None) -> str:
+        """Determine the appropriate PostgreSQL data type for a column based on its sample values"""
+        if not sample_values:
             return "TEXT"  # Default fallback
         
         # Analyze sample data for this column
-        values = []
-        for record in sample_data:
-            if column_name in record and record[column_name] is not None:
-                values.append(record[column_name])
+        values = [value for value in sample_values if value is not None]
         
         if not values:
             return "TEXT"
@@ -8,55 +8,114 @@ Features dynamic column creation and nested field flattening.
 """
 
 import argparse
+import itertools
 import logging
 import time
 import json
-from typing import List, Dict, Any, Optional, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Thread, Semaphore
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from threading import Thread, Lock
 from queue import Queue, Empty, Full
 from database import DatabaseManager
 from api_client import ReidinAPIClient
+from utils.rate_limiter import TokenBucket
+from utils import fast_json
 from processors import DataProcessor
 from config import Config
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('cma_import.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Batch size chosen by --probe-batch, reused by later runs; kept next to this script
+# so runs started from any directory share it
+BATCH_SIZE_FILE = Path(__file__).with_name('cma_batch_size.json')
+PROBE_BATCH_SIZES = (500, 1000, 2000, 5000, 10000, 20000)
+PROBE_SAMPLE_TASKS = 20
+
+# Fraction of data_queue capacity above which no new API tasks are submitted
+QUEUE_HIGH_WATER = 0.75
+
+# Results are handed to the flushers in chunks to cut queue lock round-trips
+RESULT_CHUNK_SIZE = 100
+
+# Upper bound for the flush threshold when it grows with queue depth
+MAX_ADAPTIVE_BATCH_SIZE = 20000
+
+
+class ColumnBuffer:
+    """Column-oriented (struct-of-arrays) record buffer: one list per column instead of one dict per row"""
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {}
+        self.row_count = 0
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def append(self, record: Dict[str, Any]) -> None:
+        row_count = self.row_count
+        for key, value in record.items():
+            column = self.columns.get(key)
+            if column is None:
+                # New column - earlier rows don't have it
+                column = self.columns[key] = [None] * row_count
+            column.append(value)
+        self.row_count = row_count + 1
+        
+        # Pad columns this record doesn't have so all columns stay aligned
+        if len(record) < len(self.columns):
+            for column in self.columns.values():
+                if len(column) == row_count:
+                    column.append(None)
+
+    def extend(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def clear(self) -> None:
+        self.columns = {}
+        self.row_count = 0
+
 
 class CMAImporter:
-    def __init__(self, batch_size: int = 5000, max_workers: int = 8, request_delay: float = 1.0):
+    # Request parameters stamped onto every record; known up front, so never "discovered"
+    META_KEYS = ("property_id", "alias", "currency", "measurement", "property_type", "activity_type")
+
+    def __init__(self, batch_size: int = 5000, max_workers: int = 32, request_delay: float = 1.0,
+                 flush_interval: float = 300.0, burst: int = 1, store_raw: bool = False):
         self.db = DatabaseManager()
-        self.api_client = ReidinAPIClient()
+        self.api_client = ReidinAPIClient(pool_maxsize=max_workers)
         self.processor = DataProcessor()
         self.batch_size = batch_size
+        # Workers spend almost all their time blocked on HTTP, so the pool is sized for
+        # requests in flight rather than CPU cores; the rate limiter governs throughput
         self.max_workers = max_workers
         self.request_delay = request_delay
+        self.flush_interval = flush_interval
+        # The response is already flattened into columns; keeping a JSON copy per row is opt-in
+        self.store_raw = store_raw
         
         # Track discovered columns for dynamic schema
-        self.discovered_columns = set()
+        self.discovered_columns = set(self.META_KEYS)
         self.column_mapping = {}
+        self.schema_lock = Lock()
+        # Bumped whenever discovered_columns grows so the DB layer can reuse its SQL per version
+        self.schema_version = 0
+        self.schema_columns: Tuple[str, ...] = tuple(sorted(self.discovered_columns))
         
         # Asynchronous queue for decoupling API fetching from DB inserts
-        self.data_queue = Queue(maxsize=200000)
+        # (items are chunks of up to RESULT_CHUNK_SIZE records, ~200k records total)
+        self.data_queue = Queue(maxsize=200000 // RESULT_CHUNK_SIZE)
         
         # Flusher threads control
         self.flusher_threads = []
         self.num_flushers = 8
         
-        # Bounded semaphore for controlled task submission
-        self.task_semaphore = Semaphore(max_workers * 50)
+        # Bounded window of in-flight futures; new tasks are submitted as old ones complete
+        self.max_in_flight = max_workers * 4
         
-        # Global rate limiter for API calls
-        self.last_request_time = 0
+        # Global token bucket rate limiter shared by all API workers
+        self.rate_limiter = TokenBucket(rate=1.0 / request_delay if request_delay > 0 else 0, capacity=burst)
         
         # Statistics tracking
         self.total_records_processed = 0
@@ -72,60 +131,52 @@ class CMAImporter:
 
     def _rate_limit(self):
         """Apply rate limiting to prevent API throttling"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.request_delay:
-            time.sleep(self.request_delay - time_since_last)
-        self.last_request_time = time.time()
-
-    def _discover_schema(self, data: Dict[str, Any], prefix: str = "") -> Set[str]:
-        """Recursively discover all fields in the response data"""
-        columns = set()
-        
-        for key, value in data.items():
-            column_name = f"{prefix}_{key}" if prefix else key
-            
-            if isinstance(value, dict):
-                # Recursively process nested objects
-                nested_columns = self._discover_schema(value, column_name)
-                columns.update(nested_columns)
-            elif isinstance(value, list) and value and isinstance(value[0], dict):
-                # Handle arrays of objects
-                for item in value:
-                    nested_columns = self._discover_schema(item, f"{column_name}_item")
-                    columns.update(nested_columns)
-            else:
-                # Simple field
-                columns.add(column_name)
-        
-        return columns
+        self.rate_limiter.acquire()
 
     def _flatten_data(self, data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
-        """Flatten nested data structure"""
+        """Flatten nested data structure using an explicit stack instead of recursion"""
+        # Bind globals/builtins and hot methods as locals - this loop runs for every field of every response
+        _isinstance = isinstance
+        _dict = dict
+        _list = list
+        _items = dict.items
+        _dumps = fast_json.dumps
+        
         flattened = {}
+        stack = [(prefix, iter(_items(data)))]
+        push = stack.append
+        pop = stack.pop
         
-        for key, value in data.items():
-            column_name = f"{prefix}_{key}" if prefix else key
-            
-            if isinstance(value, dict):
-                # Recursively flatten nested objects
-                nested_data = self._flatten_data(value, column_name)
-                flattened.update(nested_data)
-            elif isinstance(value, list):
-                if value and isinstance(value[0], dict):
-                    # Handle arrays of objects - flatten each item
-                    for i, item in enumerate(value):
-                        item_data = self._flatten_data(item, f"{column_name}_{i}")
-                        flattened.update(item_data)
-                else:
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                column_name = f"{prefix}_{key}" if prefix else key
+                
+                if _isinstance(value, _dict):
+                    # Descend into nested object; the parent iterator resumes afterwards
+                    push((column_name, iter(_items(value))))
+                    break
+                elif _isinstance(value, _list):
+                    if value and _isinstance(value[0], _dict):
+                        # Handle arrays of objects - flatten each item under its index
+                        push((column_name, enumerate(value)))
+                        break
                     # Simple array - store as JSON string
-                    flattened[column_name] = json.dumps(value) if value else None
+                    flattened[column_name] = _dumps(value) if value else None
+                else:
+                    # Simple field
+                    flattened[column_name] = value
             else:
-                # Simple field
-                flattened[column_name] = value
+                pop()
         
         return flattened
 
+    def _flatten_and_discover(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Set[str]]:
+        """Flatten data in a single traversal and return it together with its column set"""
+        flattened = self._flatten_data(data)
+        # The flattened keys are exactly the columns this record needs
+        return flattened, set(flattened)
+
     def _fetch_cma_data(self, property_id: int, alias: str, currency: str, measurement: str, 
                        property_type: str, activity_type: str) -> Optional[Dict[str, Any]]:
         """Fetch CMA data for a specific property and parameters"""
@@ -148,17 +199,9 @@ class CMAImporter:
             if response and response.get('data'):
                 # Add metadata
                 data = response['data']
-                data['property_id'] = property_id
-                data['alias'] = alias
-                data['currency'] = currency
-                data['measurement'] = measurement
-                data['property_type'] = property_type
-                data['activity_type'] = activity_type
-                data['raw_data'] = json.dumps(response)  # Store raw response
-                
-                # Discover new columns
-                new_columns = self._discover_schema(data)
-                self.discovered_columns.update(new_columns)
+                data.update(zip(self.META_KEYS, (property_id, alias, currency, measurement, property_type, activity_type)))
+                if self.store_raw:
+                    data['raw_data'] = fast_json.dumps(response)  # Store raw response
                 
                 return data
             else:
@@ -175,8 +218,13 @@ class CMAImporter:
             return None
             
         try:
-            # Flatten the data structure
-            flattened = self._flatten_data(data)
+            # Flatten the data structure and discover its columns in one pass
+            flattened, columns = self._flatten_and_discover(data)
+            with self.schema_lock:
+                if not columns <= self.discovered_columns:
+                    self.discovered_columns.update(columns)
+                    self.schema_version += 1
+                    self.schema_columns = tuple(sorted(self.discovered_columns))
             
             # Add processing metadata
             flattened['processed_at'] = time.time()
@@ -211,13 +259,34 @@ class CMAImporter:
         except Exception as e:
             logger.error(f"Error in API worker: {e}")
             return None
-        finally:
-            # Release semaphore
-            self.task_semaphore.release()
+
+    def _wait_for_queue_capacity(self) -> None:
+        """Hold back API submission while the flusher queue is above its high-water mark"""
+        high_water = self.data_queue.maxsize * QUEUE_HIGH_WATER
+        if self.data_queue.qsize() <= high_water:
+            return
+        
+        logger.warning(f"⚠️ Queue is {self.data_queue.qsize()}/{self.data_queue.maxsize} - pausing API submission until the DB catches up")
+        while self.data_queue.qsize() > high_water:
+            time.sleep(0.1)
+
+    def _collect_result(self, future, pending: List[Dict[str, Any]]) -> None:
+        """Add a completed API future's result to the pending chunk, enqueueing it once full"""
+        try:
+            result = future.result()
+            if result:
+                pending.append(result)
+                self.total_records_processed += 1
+        except Exception as e:
+            logger.error(f"Error processing future: {e}")
+        
+        if len(pending) >= RESULT_CHUNK_SIZE:
+            self.data_queue.put(pending.copy())
+            pending.clear()
 
     def _flusher_worker(self):
         """Dedicated worker thread that handles database inserts"""
-        buffer = []
+        buffer = ColumnBuffer()
         last_flush_time = time.time()
         
         while True:
@@ -235,14 +304,14 @@ class CMAImporter:
                     buffer.append(data)
                 
                 # Flush if buffer is full
-                if len(buffer) >= self.batch_size:
+                if len(buffer) >= self._flush_threshold():
                     self._flush_buffer(buffer)
                     buffer.clear()
                     last_flush_time = time.time()
                     
             except Empty:
                 # Timeout - check if we should flush based on time
-                if buffer and (time.time() - last_flush_time) > 300:  # 5 minute timeout
+                if buffer and (time.time() - last_flush_time) > self.flush_interval:
                     self._flush_buffer(buffer)
                     buffer.clear()
                     last_flush_time = time.time()
@@ -254,7 +323,13 @@ class CMAImporter:
             buffer.clear()
         logger.info("✅ Flusher worker completed")
 
-    def _flush_buffer(self, buffer: List[Dict[str, Any]]):
+    def _flush_threshold(self) -> int:
+        """Batch size to flush at: grows up to 5x while the queue is backed up, back to batch_size once it drains"""
+        queued_records = self.data_queue.qsize() * RESULT_CHUNK_SIZE
+        adaptive = self.batch_size * (1 + min(4, queued_records // self.batch_size))
+        return max(self.batch_size, min(adaptive, MAX_ADAPTIVE_BATCH_SIZE))
+
+    def _flush_buffer(self, buffer: ColumnBuffer):
         """Flush a buffer of records to the database"""
         if not buffer:
             return
@@ -264,7 +339,10 @@ class CMAImporter:
             start_time = time.time()
             
             # Insert data with dynamic schema
-            self.db.insert_cma_data_dynamic(buffer, self.discovered_columns)
+            # Read columns and version together so the cached SQL matches the columns
+            with self.schema_lock:
+                columns, schema_version = self.schema_columns, self.schema_version
+            self.db.insert_cma_data_dynamic(buffer.columns, columns, schema_version=schema_version)
             
             end_time = time.time()
             duration = end_time - start_time
@@ -278,6 +356,61 @@ class CMAImporter:
         except Exception as e:
             logger.error(f"❌ Failed to flush batch of {len(buffer)} records: {e}")
 
+    @staticmethod
+    def load_probed_batch_size() -> Optional[int]:
+        """Load the batch size chosen by a previous --probe-batch run"""
+        try:
+            with open(BATCH_SIZE_FILE) as f:
+                return int(json.load(f)['batch_size'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def probe_batch_size(self, sample: List[Dict[str, Any]]) -> int:
+        """Time inserts at several batch sizes and pick the knee of the throughput curve"""
+        def probe_rows(size: int) -> ColumnBuffer:
+            # Synthetic negative property ids keep the upsert keys unique; the insert is rolled back
+            rows = ColumnBuffer()
+            rows.extend(dict(sample[i % len(sample)], property_id=-(i + 1)) for i in range(size))
+            return rows
+        
+        with self.schema_lock:
+            columns, schema_version = self.schema_columns, self.schema_version
+        
+        # Untimed warm-up: creates the table/indexes and caches the upsert SQL for this schema
+        # version, so the timings below measure only the insert and don't favour large batches
+        try:
+            self.db.insert_cma_data_dynamic(probe_rows(len(sample)).columns, columns,
+                                            commit=False, schema_version=schema_version)
+        except Exception as e:
+            logger.warning(f"⚠️ Batch probe warm-up failed, keeping batch size {self.batch_size}: {e}")
+            return self.batch_size
+        
+        rates = {}
+        for size in PROBE_BATCH_SIZES:
+            rows = probe_rows(size)
+            start_time = time.time()
+            try:
+                self.db.insert_cma_data_dynamic(rows.columns, columns, commit=False, schema_version=schema_version)
+            except Exception as e:
+                logger.warning(f"⚠️ Batch probe failed at size {size}: {e}")
+                break
+            duration = time.time() - start_time
+            rates[size] = size / duration if duration > 0 else float('inf')
+            logger.info(f"📏 Batch size {size}: {rates[size]:.1f} rec/s")
+        
+        if not rates:
+            logger.warning(f"⚠️ Batch probe produced no measurements, keeping batch size {self.batch_size}")
+            return self.batch_size
+        
+        # Smallest size within 90% of the best throughput - past the knee bigger batches only add latency
+        best_rate = max(rates.values())
+        self.batch_size = min(size for size, rate in rates.items() if rate >= best_rate * 0.9)
+        
+        with open(BATCH_SIZE_FILE, 'w') as f:
+            json.dump({'batch_size': self.batch_size, 'rates': rates, 'probed_at': time.time()}, f, indent=2)
+        logger.info(f"📏 Selected batch size {self.batch_size} (saved to {BATCH_SIZE_FILE})")
+        return self.batch_size
+
     def _start_flusher_threads(self):
         """Start dedicated flusher threads"""
         self.flusher_threads = []
@@ -306,7 +439,8 @@ class CMAImporter:
         logger.info("✅ All flusher threads stopped")
 
     def process_cma(self, country_code: str = "AE", max_properties: int = 100, 
-                   max_combinations: int = 16, offset: int = 0, dry_run: bool = False):
+                   max_combinations: int = 16, offset: int = 0, dry_run: bool = False,
+                   probe_batch: bool = False):
         """Main method to process CMA data"""
         
         logger.info("🚀 Starting CMA data import with dynamic schema")
@@ -315,8 +449,10 @@ class CMAImporter:
         logger.info(f"Offset: {offset}")
         logger.info(f"Max combinations per property: {max_combinations}")
         logger.info(f"Batch size: {self.batch_size}")
+        logger.info(f"Flush interval: {self.flush_interval}s")
         logger.info(f"Max workers: {self.max_workers}")
         logger.info(f"Request delay: {self.request_delay}s")
+        logger.info(f"Store raw responses: {self.store_raw}")
         logger.info(f"Dry run: {dry_run}")
         
         try:
@@ -328,39 +464,26 @@ class CMAImporter:
                 logger.warning("No properties found in database")
                 return
             
+            # Parameter combinations are the same for every property - build them once,
+            # capped at max_combinations
+            combinations = list(itertools.islice(
+                itertools.product(self.aliases, self.currencies, self.measurements,
+                                  self.property_types, self.activity_types),
+                max_combinations
+            ))
+            
             # Generate API tasks
             api_tasks = []
             for property_data in properties:
                 property_id = property_data['id']
-                
-                # Generate combinations
-                combinations = 0
-                for alias in self.aliases:
-                    for currency in self.currencies:
-                        for measurement in self.measurements:
-                            for property_type in self.property_types:
-                                for activity_type in self.activity_types:
-                                    if combinations >= max_combinations:
-                                        break
-                                    
-                                    api_tasks.append({
-                                        'property_id': property_id,
-                                        'alias': alias,
-                                        'currency': currency,
-                                        'measurement': measurement,
-                                        'property_type': property_type,
-                                        'activity_type': activity_type
-                                    })
-                                    combinations += 1
-                                
-                                if combinations >= max_combinations:
-                                    break
-                            if combinations >= max_combinations:
-                                break
-                        if combinations >= max_combinations:
-                            break
-                    if combinations >= max_combinations:
-                        break
+                api_tasks.extend({
+                    'property_id': property_id,
+                    'alias': alias,
+                    'currency': currency,
+                    'measurement': measurement,
+                    'property_type': property_type,
+                    'activity_type': activity_type
+                } for alias, currency, measurement, property_type, activity_type in combinations)
             
             logger.info(f"Generated {len(api_tasks)} API tasks for {len(properties)} properties")
             logger.info(f"Average {len(api_tasks) / len(properties):.1f} combinations per property")
@@ -369,31 +492,49 @@ class CMAImporter:
                 logger.info("🔍 Dry run mode - no data will be inserted")
                 return
             
+            # Time inserts against a small real sample before the main run
+            sample = []
+            if probe_batch:
+                sample_tasks, api_tasks = api_tasks[:PROBE_SAMPLE_TASKS], api_tasks[PROBE_SAMPLE_TASKS:]
+                for task in sample_tasks:
+                    record = self._process_cma_data(self._fetch_cma_data(**task))
+                    if record:
+                        sample.append(record)
+                if sample:
+                    self.probe_batch_size(sample)
+                else:
+                    logger.warning(f"⚠️ No sample data for batch probe, keeping batch size {self.batch_size}")
+            
             # Start flusher threads
             self._start_flusher_threads()
             
+            # The probe sample is real data - insert it like any other result
+            if sample:
+                self.data_queue.put(sample)
+                self.total_records_processed += len(sample)
+            
             # Process API tasks
             logger.info(f"🔄 Starting parallel API processing with {self.max_workers} workers...")
             
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submit all tasks
-                futures = []
+                # Submit while completing: only max_in_flight futures exist at any time
+                in_flight = set()
+                pending = []
                 for task in api_tasks:
-                    # Acquire semaphore
-                    self.task_semaphore.acquire()
-                    
-                    future = executor.submit(self._api_worker, task)
-                    futures.append(future)
+                    self._wait_for_queue_capacity()
+                    in_flight.add(executor.submit(self._api_worker, task))
+                    if len(in_flight) >= self.max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._collect_result(future, pending)
+                
+                # Drain the remaining futures
+                for future in as_completed(in_flight):
+                    self._collect_result(future, pending)
                 
-                # Process results
-                for future in as_completed(futures):
-                    try:
-                        result = future.result()
-                        if result:
-                            self.data_queue.put(result)
-                            self.total_records_processed += 1
-                    except Exception as e:
-                        logger.error(f"Error processing future: {e}")
+                # Enqueue the last partial chunk
+                if pending:
+                    self.data_queue.put(pending)
             
             # Stop flusher threads
             self._stop_flusher_threads()
@@ -437,17 +578,40 @@ def main():
         default=1.0, 
         help="Delay between API requests in seconds (default: 1.0)"
     )
+    parser.add_argument(
+        "--burst", 
+        type=int, 
+        default=1, 
+        help="Number of API requests allowed back-to-back before request-delay pacing applies (default: 1)"
+    )
     parser.add_argument(
         "--batch-size", 
         type=int, 
-        default=5000, 
-        help="Batch size for database inserts (default: 5000)"
+        default=None, 
+        help="Batch size for database inserts (default: value saved by --probe-batch, else 5000)"
+    )
+    parser.add_argument(
+        "--probe-batch", 
+        action="store_true", 
+        help=f"Time inserts at several batch sizes on startup and save the best to {BATCH_SIZE_FILE}"
+    )
+    parser.add_argument(
+        "--flush-interval", 
+        type=float, 
+        default=300.0, 
+        help="Seconds before a partially filled buffer is flushed (default: 300)"
     )
     parser.add_argument(
         "--max-workers", 
         type=int, 
-        default=8, 
-        help="Maximum number of parallel workers (default: 8)"
+        default=32, 
+        help="Maximum number of concurrent API requests in flight (default: 32)"
+    )
+    parser.add_argument(
+        "--store-raw", 
+        action="store_true", 
+        default=Config.CMA_STORE_RAW,
+        help="Also store the raw API response as JSON in raw_data (default: off, or CMA_STORE_RAW=1)"
     )
     parser.add_argument(
         "--dry-run", 
@@ -463,11 +627,28 @@ def main():
     
     args = parser.parse_args()
     
+    # Configure logging here rather than at import, so importing the module has no side effects
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('cma_import.log'),
+            logging.StreamHandler()
+        ]
+    )
+    
+    batch_size = args.batch_size
+    if batch_size is None:
+        batch_size = CMAImporter.load_probed_batch_size() or 5000
+    
     try:
         importer = CMAImporter(
-            batch_size=args.batch_size,
+            batch_size=batch_size,
             max_workers=args.max_workers,
-            request_delay=args.request_delay
+            request_delay=args.request_delay,
+            flush_interval=args.flush_interval,
+            burst=args.burst,
+            store_raw=args.store_raw
         )
         
         importer.process_cma(
@@ -475,7 +656,8 @@ def main():
             max_properties=args.max_properties,
             max_combinations=args.max_combinations,
             offset=args.offset,
-            dry_run=args.dry_run
+            dry_run=args.dry_run,
+            probe_batch=args.probe_batch
         )
         
     except Exception as e:
@@ -167,7 +167,7 @@ class CMA2RentsImporter:
     def get_processed_property_ids(self) -> set:
         """Get set of property IDs that have already been processed with current parameter combinations (for resume capability)"""
         try:
-            with self.db.get_connection() as conn:
+            with self.db.pooled_connection() as conn:
                 with conn.cursor() as cur:
                     # Check for properties that have been processed with current parameter combinations
                     cur.execute('''
@@ -9,13 +9,14 @@ It processes properties and fetches CMA sales data for each property with variou
 import argparse
 import logging
 import time
-from typing import List, Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Thread, Semaphore
+from typing import List, Dict, Any, Optional, NamedTuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from threading import Thread
 from queue import Queue, Empty, Full
 from database import DatabaseManager
 from api_client import ReidinAPIClient
-from processors import DataProcessor
+from utils.rate_limiter import TokenBucket
+from processors import DataProcessor, CMASalesRecord
 from config import Config
 
 # Configure logging
@@ -29,34 +30,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Fraction of the flusher queue above which new API tasks are held back
+QUEUE_HIGH_WATER = 0.75
+
+
+class CMASalesTask(NamedTuple):
+    """A single CMA sales API call (REQUIRED parameters + optional filters)"""
+    property_id: str | int
+    alias: str
+    currency: str
+    measurement: str
+    property_type: str
+    property_subtype: str
+    no_of_bedrooms: Optional[int] = None
+    size: Optional[str] = None
+    sales_activity_type: Optional[str] = None
+    lat: Optional[str] = None
+    lon: Optional[str] = None
+
 
 class CMASalesImporter:
-    def __init__(self, batch_size: int = 5000, max_workers: int = 8, request_delay: float = 1.0):
+    def __init__(self, batch_size: int = 5000, max_workers: int = 8, request_delay: float = 1.0, burst: int = 1, store_raw: bool = False, batch_subtypes: bool = False):
         self.db = DatabaseManager()
-        self.api_client = ReidinAPIClient()
+        self.api_client = ReidinAPIClient(pool_maxsize=max_workers)
         self.processor = DataProcessor()
         self.batch_size = batch_size
         self.max_workers = max_workers
-        self.request_delay = request_delay
+        self.store_raw = store_raw  # Keep the full API item in raw_data (off by default to save memory)
+        # Request all subtypes of a property type in one call (comma-separated property_subtype).
+        # Off by default: the last-N aliases cap each response, so a combined call can return
+        # fewer comparables than one call per subtype.
+        self.batch_subtypes = batch_subtypes
         
-        # Asynchronous queue for decoupling API fetching from DB inserts (with backpressure)
-        self.data_queue = Queue(maxsize=200000)  # Increased for better throughput - prevents backpressure
+        # Asynchronous queue for decoupling API fetching from DB inserts (with backpressure).
+        # Each item is the record list of one API response, not a single record.
+        self.data_queue = Queue(maxsize=20000)
         
         # Flusher threads control (multiple flushers for better DB throughput)
         self.flusher_threads = []
         self.num_flushers = 6  # Increased for M3 Mac performance (6-8 flushers)
         self.processing_complete = False  # Signal to indicate processing is done
         
-        # Bounded semaphore for controlled task submission
-        self.task_semaphore = Semaphore(max_workers * 50)  # Balanced limit for sliding window
+        # Bounded window of in-flight futures; new tasks are submitted as old ones complete
+        self.max_in_flight = max_workers * 4
         
-        # Global rate limiter for API calls (prevents 429 errors)
-        self.rate_limiter = Semaphore(1)  # Global rate limiting
-        self.last_request_time = 0
+        # Global token bucket rate limiter for API calls (prevents 429 errors); workers only
+        # hold its lock to reserve a token and sleep outside it, so HTTP calls overlap freely
+        self.rate_limiter = TokenBucket(rate=1.0 / request_delay if request_delay > 0 else 0, capacity=burst)
         
         # Statistics
         self.total_records_inserted = 0
         self.total_batches_flushed = 0
+        self.successful_tasks = 0
+        self.failed_tasks = 0
+        self.total_records_processed = 0
         
         self.aliases = ["last-fifteen"] 
         self.currencies = ["aed"] 
@@ -110,6 +137,26 @@ class CMASalesImporter:
         #     "Sized Partition", "Whole Building" ]   # REQUIRED
         # self.property_subtypes = [
         #     "Medical Office", "Office", "Sized Partition", "Whole Building" ]  # REQUIRED
+        
+        # Parameter combinations are the same for every property, so build them once
+        if batch_subtypes:
+            self._combo_templates = tuple(
+                (alias, currency, measurement, property_type, ",".join(self.property_type_subtypes[property_type]))
+                for alias in self.aliases
+                for currency in self.currencies
+                for measurement in self.measurements
+                for property_type in self.property_types
+                if self.property_type_subtypes.get(property_type)
+            )
+        else:
+            self._combo_templates = tuple(
+                (alias, currency, measurement, property_type, property_subtype)
+                for alias in self.aliases
+                for currency in self.currencies
+                for measurement in self.measurements
+                for property_type in self.property_types
+                for property_subtype in self.property_type_subtypes.get(property_type, ())
+            )
 
     def start_flusher_threads(self):
         """Start multiple dedicated flusher threads for better DB throughput"""
@@ -183,7 +230,7 @@ class CMASalesImporter:
             buffer.clear()
         logger.info("✅ Flusher worker completed")
 
-    def _flush_buffer(self, buffer: List[Dict[str, Any]]):
+    def _flush_buffer(self, buffer: List[CMASalesRecord]):
         """Flush a buffer of records to the database"""
         if not buffer:
             return
@@ -212,12 +259,6 @@ class CMASalesImporter:
                 # Warning if queue is getting too full
                 if queue_size > self.data_queue.maxsize * 0.8:
                     logger.warning(f"⚠️ Queue is {queue_size}/{self.data_queue.maxsize} (~{queue_size/self.data_queue.maxsize*100:.1f}% full) - DB may be falling behind")
-                
-                # Monitor semaphore usage
-                available_slots = self.task_semaphore._value
-                total_slots = self.max_workers * 50
-                if available_slots < total_slots * 0.1:  # Less than 10% available
-                    logger.warning(f"⚠️ Task semaphore is {total_slots - available_slots}/{total_slots} slots used - may need tuning")
             
         except Exception as e:
             logger.error(f"❌ Failed to flush batch of {len(buffer)} records: {e}")
@@ -234,71 +275,73 @@ class CMASalesImporter:
                 except Exception as retry_e:
                     logger.error(f"❌ Failed to re-queue chunk for retry: {retry_e}")
 
-    def get_properties(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
-        """Get properties from the database with optional offset for batch processing"""
+    def get_properties(self, limit: Optional[int] = None, after_id: int = 0) -> List[Dict[str, Any]]:
+        """Get unprocessed properties with id > after_id, paging through them by id (keyset pagination)
+        
+        Properties that already have CMA sales rows for the current alias/currency/measurement
+        are skipped in SQL, which gives resume capability without loading processed IDs.
+        """
         try:
-            properties = self.db.get_properties(limit=limit, offset=offset)
-            logger.info(f"Retrieved {len(properties)} properties from database (offset: {offset})")
+            properties = []
+            last_id = after_id
+            while limit is None or len(properties) < limit:
+                page_size = Config.BATCH_SIZE if limit is None else min(Config.BATCH_SIZE, limit - len(properties))
+                page = self.db.get_unprocessed_properties_after(
+                    alias=self.aliases[0],
+                    currency=self.currencies[0],
+                    measurement=self.measurements[0],
+                    property_types=self.property_types,
+                    last_id=last_id,
+                    limit=page_size
+                )
+                properties.extend(page)
+                if len(page) < page_size:
+                    break
+                last_id = page[-1]["id"]
+            
+            logger.info(f"Retrieved {len(properties)} unprocessed properties from database (after id: {after_id})")
             return properties
         except Exception as e:
             logger.error(f"Failed to get properties: {e}")
             return []
 
-    
-    
-
-    def get_processed_property_ids(self) -> set:
-        """Get set of property IDs that have already been processed with current parameter combinations (for resume capability)"""
+    def add_to_queue(self, data: List[CMASalesRecord]) -> None:
+        """Add processed data to the queue for the flusher thread as a single item"""
         try:
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cur:
-                    # Check for properties already processed with current target combinations
-                    cur.execute('''
-                        SELECT DISTINCT property_id 
-                        FROM cma_sales 
-                        WHERE alias = %s 
-                        AND currency = %s 
-                        AND measurement = %s 
-                        AND property_type = %s 
-                        AND property_subtype IN (%s, %s)
-                    ''', (self.aliases[0], self.currencies[0], self.measurements[0], 
-                          self.property_types[0], self.property_subtypes[0], self.property_subtypes[1]))
-                    processed_ids = {row[0] for row in cur.fetchall()}
-                    logger.info(f"Found {len(processed_ids)} already processed property IDs with current combinations")
-                    return processed_ids
+            self.data_queue.put(data, timeout=5.0)
+        except Full:
+            logger.error(f"❌ Queue is full, cannot add batch of {len(data)} records. Queue size: {self.data_queue.qsize()}")
         except Exception as e:
-            logger.error(f"Failed to get processed property IDs: {e}")
-            return set()
+            logger.error(f"❌ Failed to add batch of {len(data)} records to queue: {e}")
 
-    def add_to_queue(self, data: List[Dict[str, Any]]) -> None:
-        """Add processed data to the queue for the flusher thread"""
-        for record in data:
-            try:
-                self.data_queue.put(record, timeout=5.0)
-            except Full:
-                logger.error(f"❌ Queue is full, cannot add record. Queue size: {self.data_queue.qsize()}")
-            except Exception as e:
-                logger.error(f"❌ Failed to add record to queue: {e}")
+    def _wait_for_queue_capacity(self) -> None:
+        """Hold back API submission while the flusher queue is above its high-water mark"""
+        high_water = self.data_queue.maxsize * QUEUE_HIGH_WATER
+        if self.data_queue.qsize() <= high_water:
+            return
+        
+        logger.warning(f"⚠️ Queue is {self.data_queue.qsize()}/{self.data_queue.maxsize} - pausing API submission until the DB catches up")
+        while self.data_queue.qsize() > high_water:
+            time.sleep(0.1)
 
-    def _process_with_semaphore(self, task: Dict[str, Any], country_code: str) -> int:
-        """Process a single API call with semaphore control"""
+    def _collect_result(self, future, task: CMASalesTask, total_tasks: int) -> None:
+        """Record the outcome of a completed API future and log progress"""
         try:
-            return self.process_single_api_call(
-                task["property_id"],
-                task["alias"],
-                task["currency"],
-                task["measurement"],
-                task["property_type"],
-                task["property_subtype"],
-                task["no_of_bedrooms"],
-                task["size"],
-                task["sales_activity_type"],
-                task["lat"],
-                task["lon"],
-                country_code
-            )
-        finally:
-            self.task_semaphore.release()  # Always release semaphore
+            self.total_records_processed += future.result()
+            self.successful_tasks += 1
+        except Exception as e:
+            self.failed_tasks += 1
+            logger.error(f"❌ Task failed for property {task.property_id}: {e}")
+        
+        # Log progress every 1000 tasks
+        completed = self.successful_tasks + self.failed_tasks
+        if completed % 1000 == 0:
+            try:
+                import psutil
+                memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
+                logger.info(f"📊 Progress: {completed}/{total_tasks} tasks completed, {self.total_records_processed} records processed, Memory: {memory_mb:.1f}MB")
+            except ImportError:
+                logger.info(f"📊 Progress: {completed}/{total_tasks} tasks completed, {self.total_records_processed} records processed")
 
     def process_single_api_call(
         self, 
@@ -318,12 +361,7 @@ class CMASalesImporter:
         """Process a single API call with all parameters (REQUIRED + optional)"""
         try:
             # Global rate limiting to prevent 429 errors
-            with self.rate_limiter:
-                current_time = time.time()
-                time_since_last = current_time - self.last_request_time
-                if time_since_last < self.request_delay:
-                    time.sleep(self.request_delay - time_since_last)
-                self.last_request_time = time.time()
+            self.rate_limiter.acquire()
             
             # Fetch data from API with all parameters
             response = self.api_client.fetch_cma_sales(
@@ -353,12 +391,14 @@ class CMASalesImporter:
                     currency=currency,
                     measurement=measurement,
                     property_type=property_type,
-                    property_subtype=property_subtype,
+                    # A combined subtype request returns several subtypes; take each row's own
+                    property_subtype=None if self.batch_subtypes else property_subtype,
                     no_of_bedrooms=no_of_bedrooms,
                     size=size,
                     sales_activity_type=sales_activity_type,
                     lat=lat,
-                    lon=lon
+                    lon=lon,
+                    keep_raw=self.store_raw
                 )
                 
                 if processed_data:
@@ -369,53 +409,28 @@ class CMASalesImporter:
             return 0
             
         except Exception as e:
-            # Create a more descriptive error message
-            param_str = f"{alias}_{currency}_{measurement}_{property_type}_{property_subtype}"
-            if no_of_bedrooms is not None:
-                param_str += f"_bed{no_of_bedrooms}"
-            if size:
-                param_str += f"_size{size}"
-            if sales_activity_type:
-                param_str += f"_{sales_activity_type.replace(' ', '_')}"
-            
-            logger.warning(f"Property {property_id}: Failed combination {param_str} - {e}")
+            # Lazy %-formatting: the message is only built if the record is actually emitted
+            logger.warning(
+                "Property %s: Failed combination %s_%s_%s_%s_%s (bedrooms=%s, size=%s, activity=%s) - %s",
+                property_id, alias, currency, measurement, property_type, property_subtype,
+                no_of_bedrooms, size, sales_activity_type, e
+            )
             return 0
 
     def generate_api_tasks(
         self, 
         properties: List[Dict[str, Any]], 
         max_combinations_per_property: int = 20
-    ) -> List[Dict[str, Any]]:
-        """Generate API tasks using simple approach - all subtypes for all properties"""
-        tasks = []
-        
-        for property_data in properties:
-            property_id = property_data.get("id")
-            if not property_id:
-                continue
-                
-            # Optimized approach: use only relevant subtypes for each property type
-            for alias in self.aliases:
-                for currency in self.currencies:
-                    for measurement in self.measurements:
-                        for property_type in self.property_types:
-                            # Get only relevant subtypes for this property type
-                            relevant_subtypes = self.property_type_subtypes.get(property_type, [])
-                            for property_subtype in relevant_subtypes:
-                                # Only REQUIRED parameters - no optional parameters
-                                tasks.append({
-                                    "property_id": property_id,
-                                    "alias": alias,
-                                    "currency": currency,
-                                    "measurement": measurement,
-                                    "property_type": property_type,
-                                    "property_subtype": property_subtype,
-                                    "no_of_bedrooms": None,
-                                    "size": None,
-                                    "sales_activity_type": None,
-                                    "lat": None,
-                                    "lon": None
-                                })
+    ) -> List[CMASalesTask]:
+        """Generate API tasks using simple approach - all relevant subtypes for all properties"""
+        # Only REQUIRED parameters - optional filters keep their None defaults
+        combos = self._combo_templates
+        tasks = [
+            CMASalesTask(property_id, *combo)
+            for property_id in (property_data.get("id") for property_data in properties)
+            if property_id
+            for combo in combos
+        ]
         
         logger.info(f"Generated {len(tasks)} API tasks for {len(properties)} properties")
         logger.info(f"Average {len(tasks) / len(properties):.1f} combinations per property")
@@ -426,46 +441,41 @@ class CMASalesImporter:
         country_code: str = "AE",
         max_properties: int = 500,
         max_combinations_per_property: int = 10,
-        request_delay: float = 0.25,
         dry_run: bool = False,
-        offset: int = 0
+        after_id: int = 0
     ) -> None:
         """Main method to process CMA sales data with parallel API fetching and serialized DB inserts"""
         
         logger.info("🚀 Starting CMA Sales data import with new architecture")
         logger.info(f"Country: {country_code}")
         logger.info(f"Max properties: {max_properties}")
-        logger.info(f"Offset: {offset}")
+        logger.info(f"After property id: {after_id}")
         logger.info(f"Max combinations per property: {max_combinations_per_property}")
         logger.info(f"Batch size: {self.batch_size}")
         logger.info(f"Max workers: {self.max_workers}")
-        logger.info(f"Request delay: {request_delay}s")
+        if self.rate_limiter.rate > 0:
+            logger.info(f"Rate limit: {self.rate_limiter.rate:.2f} req/s (burst {self.rate_limiter.capacity})")
+        else:
+            logger.info("Rate limit: none")
         logger.info(f"Dry run: {dry_run}")
         
         if dry_run:
             logger.info("🧪 DRY RUN MODE - No data will be inserted")
             return
         
-        # Get properties from database with offset
-        properties = self.get_properties(limit=max_properties, offset=offset)
+        # Get properties from database after the given id
+        properties = self.get_properties(limit=max_properties, after_id=after_id)
         
         if not properties:
             logger.error("No properties found in database")
             return
+        logger.info(f"Last property id in this batch: {properties[-1]['id']} (pass as --after-id to continue)")
         
         # Generate all API tasks
         logger.info("📋 Generating API tasks...")
         api_tasks = self.generate_api_tasks(properties, max_combinations_per_property)
         logger.info(f"Generated {len(api_tasks)} API tasks")
         
-        # Filter out already processed property IDs for resume capability
-        processed_property_ids = self.get_processed_property_ids()
-        if processed_property_ids:
-            original_count = len(api_tasks)
-            api_tasks = [task for task in api_tasks if task['property_id'] not in processed_property_ids]
-            skipped_count = original_count - len(api_tasks)
-            logger.info(f"🔄 Resume mode: Skipped {skipped_count} already processed tasks, {len(api_tasks)} remaining")
-        
         if not api_tasks:
             logger.warning("No API tasks generated")
             return
@@ -477,60 +487,23 @@ class CMASalesImporter:
             # Start parallel API processing with chunked submission
             logger.info(f"🔄 Starting parallel API processing with {self.max_workers} workers...")
             
-            successful_tasks = 0
-            failed_tasks = 0
-            total_records_processed = 0
-            
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Use batch processing approach: submit tasks in batches to control memory
-                max_futures_in_memory = self.max_workers * 20  # Keep more futures for better parallelism
-                logger.info(f"📦 Processing {len(api_tasks)} tasks in batches (max {max_futures_in_memory} futures per batch)")
+                # Submit while completing: only max_in_flight futures exist at any time,
+                # so workers never idle waiting for the slowest task of a batch
+                logger.info(f"📦 Processing {len(api_tasks)} tasks (max {self.max_in_flight} futures in flight)")
+                in_flight = {}
+                for task in api_tasks:
+                    self._wait_for_queue_capacity()
+                    future = executor.submit(self.process_single_api_call, *task, country_code=country_code)
+                    in_flight[future] = task
+                    if len(in_flight) >= self.max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._collect_result(future, in_flight.pop(future), len(api_tasks))
                 
-                # Submit all tasks in batches to control memory
-                batch_size = max_futures_in_memory
-                for i in range(0, len(api_tasks), batch_size):
-                    batch_tasks = api_tasks[i:i + batch_size]
-                    logger.info(f"📦 Submitting batch {i//batch_size + 1}/{(len(api_tasks) + batch_size - 1)//batch_size} ({len(batch_tasks)} tasks)")
-                    
-                    # Submit batch
-                    batch_futures = []
-                    for task in batch_tasks:
-                        self.task_semaphore.acquire()
-                        future = executor.submit(
-                            self._process_with_semaphore,
-                            task,
-                            country_code
-                        )
-                        batch_futures.append((future, task))
-                    
-                    # Process completed futures in this batch
-                    for future, task in batch_futures:
-                        try:
-                            records_processed = future.result(timeout=30)  # 30 second timeout
-                            successful_tasks += 1
-                            total_records_processed += records_processed
-                            
-                            # Log progress every 1000 tasks
-                            if (successful_tasks + failed_tasks) % 1000 == 0:
-                                logger.info(f"📊 Progress: {successful_tasks + failed_tasks}/{len(api_tasks)} tasks completed, {total_records_processed} records processed")
-                                
-                        except TimeoutError:
-                            failed_tasks += 1
-                            logger.error(f"❌ Task timed out after 30 seconds for property {task['property_id']}")
-                        except Exception as e:
-                            failed_tasks += 1
-                            logger.error(f"❌ Task failed for property {task['property_id']}: {e}")
-                    
-                    # Log memory usage every batch
-                    try:
-                        import psutil
-                        memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
-                        logger.info(f"✅ Batch completed: {len(batch_tasks)} tasks, Memory: {memory_mb:.1f}MB")
-                    except ImportError:
-                        logger.info(f"✅ Batch completed: {len(batch_tasks)} tasks")
-                    
-                    # Clear batch futures to free memory
-                    batch_futures.clear()
+                # Drain the remaining futures
+                for future in as_completed(in_flight):
+                    self._collect_result(future, in_flight[future], len(api_tasks))
         
             # Stop the flusher thread and wait for final flush
             logger.info("🔄 Signaling processing completion and stopping flusher threads...")
@@ -540,9 +513,9 @@ class CMASalesImporter:
             # Final summary
             logger.info("🎉 CMA Sales import completed!")
             logger.info(f"Total API tasks: {len(api_tasks)}")
-            logger.info(f"Successful tasks: {successful_tasks}")
-            logger.info(f"Failed tasks: {failed_tasks}")
-            logger.info(f"Total records processed: {total_records_processed}")
+            logger.info(f"Successful tasks: {self.successful_tasks}")
+            logger.info(f"Failed tasks: {self.failed_tasks}")
+            logger.info(f"Total records processed: {self.total_records_processed}")
             logger.info(f"Total records inserted: {self.total_records_inserted}")
             logger.info(f"Total batches flushed: {self.total_batches_flushed}")
             logger.info(f"Average records per batch: {self.total_records_inserted / max(self.total_batches_flushed, 1):.1f}")
@@ -580,6 +553,12 @@ def main():
         default=1.0, 
         help="Delay between API requests in seconds (default: 1.0)"
     )
+    parser.add_argument(
+        "--burst", 
+        type=int, 
+        default=1, 
+        help="Number of API requests allowed back-to-back before request-delay pacing applies (default: 1)"
+    )
     parser.add_argument(
         "--batch-size", 
         type=int, 
@@ -598,10 +577,21 @@ def main():
         help="Run in dry-run mode (no data insertion)"
     )
     parser.add_argument(
-        "--offset", 
+        "--after-id", 
         type=int, 
         default=0, 
-        help="Offset for property processing (for batch processing)"
+        help="Only process properties with id greater than this (for batch processing)"
+    )
+    parser.add_argument(
+        "--batch-subtypes", 
+        action="store_true", 
+        help="Request all subtypes of a property type in one API call (fewer calls; last-N aliases may return fewer comparables)"
+    )
+    parser.add_argument(
+        "--store-raw", 
+        action="store_true", 
+        default=Config.CMA_STORE_RAW,
+        help="Also store the raw API response as JSON in raw_data (default: off, or CMA_STORE_RAW=1)"
     )
     
     args = parser.parse_args()
@@ -610,7 +600,10 @@ def main():
         importer = CMASalesImporter(
             batch_size=args.batch_size,
             max_workers=args.max_workers,
-            request_delay=args.request_delay
+            request_delay=args.request_delay,
+            burst=args.burst,
+            store_raw=args.store_raw,
+            batch_subtypes=args.batch_subtypes
         )
         
         
@@ -618,9 +611,8 @@ def main():
             country_code=args.country_code,
             max_properties=args.max_properties,
             max_combinations_per_property=args.max_combinations,
-            request_delay=args.request_delay,
             dry_run=args.dry_run,
-            offset=args.offset
+            after_id=args.after_id
         )
         
     except Exception as e:
@@ -179,7 +179,7 @@ class IndicatorLocationIDImporter:
     def get_processed_location_ids(self) -> set:
         """Get set of location IDs that have already been processed with current parameter combinations (for resume capability)"""
         try:
-            with self.db.get_connection() as conn:
+            with self.db.pooled_connection() as conn:
                 with conn.cursor() as cur:
                     # Check for locations that have been processed with current parameter combinations
                     cur.execute('''
@@ -19,10 +19,12 @@ class IndicatorAliasedImporter:
         self,
         country_code: str,
         limit: Optional[int] = None,
-        params: Dict[str, Any] = Config.DEFAULT_PARAMS,
+        params: Dict[str, Any] | None = None,
         key: str = "location_id",
     ) -> List[Dict[str, Any]]:
         """Fetch property-level indicators for a country."""
+        # A private copy: the id filter for each batch is written into it below
+        params = dict(Config.DEFAULT_PARAMS if params is None else params)
         batch_indicators: List[Dict[str, Any]] = []
         all_indicators = 0
 
@@ -71,11 +73,10 @@ class IndicatorAliasedImporter:
             )
 
             try:
-                with self.api_client as client:
-                    params[key] = ",".join(map(str, batch_ids))
-                    logger.info("Params: %s", params)
+                params[key] = ",".join(map(str, batch_ids))
+                logger.info("Params: %s", params)
 
-                    raw = client.get_indicators_aliases(country_code, params)
+                raw = self.api_client.get_indicators_aliases(country_code, params)
 
                 if not isinstance(raw, dict):
                     logger.warning(
@@ -108,11 +109,13 @@ class IndicatorAliasedImporter:
         country_code: str,
         limit: Optional[int] = None,
         dry_run: bool = False,
-        params: Dict[str, Any] = Config.DEFAULT_PARAMS,
+        params: Dict[str, Any] | None = None,
         key: str = "location_id",
     ) -> None:
         """Retrieve, process, and optionally store indicator aliased data."""
-        indicators_data = self.get_indicators_aliased(country_code, limit, params, key)
+        # One session (and its keep-alive connections) for the whole import
+        with self.api_client:
+            indicators_data = self.get_indicators_aliased(country_code, limit, params, key)
 
         if not indicators_data:
             logger.warning("No indicators data retrieved.")
@@ -1,7 +1,7 @@
 import argparse
 import logging
 import sys
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from api_client import ReidinAPIClient
 from processors import DataProcessor
 from database import DatabaseManager
@@ -19,6 +19,15 @@ class LocationImporter:
     ) -> List[Dict[str, Any]]:
         """Fetch all locations for a given country code."""
         all_locations: List[Dict[str, Any]] = []
+        for results in self.iter_location_pages(country_code, page_size):
+            all_locations.extend(results)
+        return all_locations
+
+    def iter_location_pages(
+        self, country_code: str, page_size: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield locations one scroll page at a time, so callers only hold one page in memory."""
+        fetched = 0
         scroll_id: Optional[str] = None
         iteration = 0
 
@@ -40,10 +49,11 @@ class LocationImporter:
                     break
                 scroll_new = raw.get("scroll_id")
 
-                all_locations.extend(results)
+                fetched += len(results)
                 logger.info(
-                    "Fetched batch of %d, total %d", len(results), len(all_locations)
+                    "Fetched batch of %d, total %d", len(results), fetched
                 )
+                yield results
 
                 if scroll_id == scroll_new or not scroll_new:
                     logger.info("No new scroll_id, stopping.")
@@ -52,25 +62,26 @@ class LocationImporter:
                 scroll_id = scroll_new
                 logger.info("scroll_id: %s", scroll_id)
 
-        return all_locations
-
     def process_locations(
         self, country_code: str, limit: Optional[int] = None, dry_run: bool = False
     ) -> None:
-        """Retrieve, process, and optionally store locations data."""
-        location_data = self.get_locations(country_code, limit)
-        if not location_data:
+        """Retrieve, process, and optionally store locations data, one scroll page at a time."""
+        stats = {"total": 0, "missing": 0}
+        for location_data in self.iter_location_pages(country_code, limit):
+            processed = DataProcessor.process_location_data(location_data)
+            for name, value in DataProcessor.validate_data_quality(processed).items():
+                stats[name] += value
+
+            if not dry_run and processed:
+                self.db.insert_location_data(processed)
+
+        if not stats["total"]:
             logger.warning("No data retrieved from API.")
             return
 
-        logger.info("Total records retrieved: %d", len(location_data))
-        processed = DataProcessor.process_location_data(location_data)
-        stats = DataProcessor.validate_data_quality(processed)
+        logger.info("Total records retrieved: %d", stats["total"])
         logger.info("Validation stats: %s", stats)
-
-        if not dry_run and processed:
-            self.db.insert_location_data(processed)
-        elif dry_run:
+        if dry_run:
             logger.info("Dry run: no database write performed.")
 
 
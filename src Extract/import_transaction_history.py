@@ -7,13 +7,16 @@ and stores it in the database following the same ETL pattern as other importers.
 """
 
 import argparse
+import itertools
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional
 
 from database import DatabaseManager
 from api_client import ReidinAPIClient
 from processors import DataProcessor
+from utils.buffered_inserter import BufferedInserter
+from utils.rate_limiter import TokenBucket
 
 # Configure logging
 logging.basicConfig(
@@ -30,9 +33,59 @@ logger = logging.getLogger(__name__)
 class TransactionHistoryImporter:
     """Importer for transaction history data from Reidin API"""
     
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.api_client = ReidinAPIClient()
+    def __init__(self, max_workers: int = 4):
+        self.db = DatabaseManager(synchronous_commit=False)
+        self.max_workers = max_workers
+        self.api_client = ReidinAPIClient(pool_maxsize=max_workers)
+    
+    def _fetch_combination(
+        self,
+        country_code: str,
+        base_params: Dict[str, Any],
+        area: str,
+        land: str,
+        max_pages: int,
+        rate_limiter: TokenBucket
+    ) -> List[Dict[str, Any]]:
+        """Walk the pages of one (area, land) combination until the first empty page"""
+        logger.info("Processing area=%s, land=%s", area, land)
+        combination_data = []
+        # Built once per combination; only the page number changes between requests
+        params = dict(base_params, municipal_area=area, land_number=land)
+        
+        for page in range(1, max_pages + 1):
+            try:
+                params["page_number"] = page
+                
+                # Rate limiting (shared by all combinations)
+                rate_limiter.acquire()
+                raw = self.api_client.fetch_transaction_history(country_code, params)
+
+                if not isinstance(raw, dict) or "results" not in raw:
+                    logger.warning(
+                        "Unexpected API response for area=%s, land=%s, page=%d: %r",
+                        area, land, page, raw,
+                    )
+                    break
+
+                results = raw.get("results", [])
+                logger.info(
+                    "Found %d transaction history records for area=%s, land=%s, page=%d", 
+                    len(results), area, land, page
+                )
+
+                if results:
+                    combination_data.extend(results)
+                else:
+                    # Stop paging on first empty page
+                    break
+                
+            except Exception as e:
+                logger.error("Failed to fetch data for area=%s, land=%s, page=%d: %s", 
+                           area, land, page, e)
+                break
+        
+        return combination_data
     
     def process_transaction_history(
         self,
@@ -51,6 +104,7 @@ class TransactionHistoryImporter:
         unit_max_size: Optional[float] = None,
         max_pages: int = 10,
         request_delay: float = 0.25,
+        burst: int = 1,
         dry_run: bool = False
     ) -> None:
         """
@@ -71,7 +125,8 @@ class TransactionHistoryImporter:
             unit_min_size: Optional minimum unit size filter
             unit_max_size: Optional maximum unit size filter
             max_pages: Maximum pages to fetch per area/land combination
-            request_delay: Delay between API requests in seconds
+            request_delay: Average interval between API requests in seconds (shared by all workers)
+            burst: Requests that may be sent back to back after an idle spell
             dry_run: If True, don't save to database
         """
         logger.info("Starting transaction history import for: %s", country_code)
@@ -82,112 +137,100 @@ class TransactionHistoryImporter:
             logger.error("Please provide at least one municipal area and one land number")
             return
         
-        transaction_history_data = []
+        total_records = 0
         successful_combinations = 0
         failed_combinations = 0
         
+        # Parameters shared by every (area, land) combination
+        base_params = {
+            "municipal_property_type": municipal_property_type,
+            "currency": currency,
+            "measurement": measurement,
+        }
+        
+        # Add optional filters that were given
+        optional_filters = {
+            "transaction_type": transaction_type,
+            "building_number": building_number,
+            "building_name": building_name,
+            "unit": unit,
+            "floor": floor,
+            "unit_min_size": unit_min_size,
+            "unit_max_size": unit_max_size,
+        }
+        base_params.update({key: value for key, value in optional_filters.items() if value})
+        
+        # Repeated areas or land numbers would fetch and upsert the same pages again
+        municipal_areas = list(dict.fromkeys(municipal_areas))
+        land_numbers = list(dict.fromkeys(land_numbers))
+        
+        rate_limiter = TokenBucket(rate=1.0 / request_delay if request_delay > 0 else 0, capacity=burst)
+        logger.info("Rate limit: %.2f req/s (burst %d)", rate_limiter.rate, rate_limiter.capacity)
+        
         try:
-            with self.api_client as client:
-                for area in municipal_areas:
-                    for land in land_numbers:
-                        logger.info("Processing area=%s, land=%s", area, land)
-                        combination_data = []
+            # Combinations are independent: page through them concurrently and
+            # process/save each one here as soon as it completes
+            with self.api_client, ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                    BufferedInserter(self.db.insert_transaction_history_data, name="transaction_history") as inserter:
+                futures = {
+                    executor.submit(
+                        self._fetch_combination, country_code, base_params, area, land, max_pages, rate_limiter
+                    ): (area, land)
+                    for area, land in itertools.product(municipal_areas, land_numbers)
+                }
+                
+                for future in as_completed(futures):
+                    area, land = futures[future]
+                    combination_data = future.result()
+                    
+                    if combination_data:
+                        # Process the data for this combination
+                        processed = DataProcessor.process_transaction_history_data(
+                            combination_data, 
+                            area, 
+                            land,
+                            transaction_type,
+                            building_number,
+                            building_name,
+                            unit,
+                            floor,
+                            unit_min_size,
+                            unit_max_size
+                        )
                         
-                        for page in range(1, max_pages + 1):
-                            try:
-                                # Build parameters for the API call
-                                params = {
-                                    "municipal_property_type": municipal_property_type,
-                                    "municipal_area": area,
-                                    "land_number": land,
-                                    "currency": currency,
-                                    "measurement": measurement,
-                                    "page_number": page,
-                                }
-                                
-                                # Add optional filters
-                                if transaction_type:
-                                    params["transaction_type"] = transaction_type
-                                if building_number:
-                                    params["building_number"] = building_number
-                                if building_name:
-                                    params["building_name"] = building_name
-                                if unit:
-                                    params["unit"] = unit
-                                if floor:
-                                    params["floor"] = floor
-                                if unit_min_size:
-                                    params["unit_min_size"] = unit_min_size
-                                if unit_max_size:
-                                    params["unit_max_size"] = unit_max_size
-
-                                raw = client.fetch_transaction_history(country_code, params)
-
-                                if not isinstance(raw, dict) or "results" not in raw:
-                                    logger.warning(
-                                        "Unexpected API response for area=%s, land=%s, page=%d: %r",
-                                        area, land, page, raw,
-                                    )
-                                    break
-
-                                results = raw.get("results", [])
+                        if processed:
+                            if not dry_run:
+                                inserter.submit(processed)
                                 logger.info(
-                                    "Found %d transaction history records for area=%s, land=%s, page=%d", 
-                                    len(results), area, land, page
+                                    "Queued %d transaction history records for area=%s, land=%s",
+                                    len(processed), area, land
                                 )
-
-                                if results:
-                                    combination_data.extend(results)
-                                else:
-                                    # Stop paging on first empty page
-                                    break
-                                
-                                # Rate limiting
-                                time.sleep(request_delay)
-                                
-                            except Exception as e:
-                                logger.error("Failed to fetch data for area=%s, land=%s, page=%d: %s", 
-                                           area, land, page, e)
-                                break
-                        
-                        if combination_data:
-                            # Process the data for this combination
-                            processed = DataProcessor.process_transaction_history_data(
-                                combination_data, 
-                                area, 
-                                land,
-                                transaction_type,
-                                building_number,
-                                building_name,
-                                unit,
-                                floor,
-                                unit_min_size,
-                                unit_max_size
-                            )
-                            
-                            if processed:
-                                if not dry_run:
-                                    self.db.insert_transaction_history_data(processed)
-                                    logger.info(
-                                        "Saved %d transaction history records for area=%s, land=%s",
-                                        len(processed), area, land
-                                    )
-                                else:
-                                    logger.info(
-                                        "DRY RUN: Would save %d transaction history records for area=%s, land=%s",
-                                        len(processed), area, land
-                                    )
-                                
-                                transaction_history_data.extend(processed)
-                                successful_combinations += 1
                             else:
-                                logger.warning("No processed data for area=%s, land=%s", area, land)
-                                failed_combinations += 1
+                                logger.info(
+                                    "DRY RUN: Would save %d transaction history records for area=%s, land=%s",
+                                    len(processed), area, land
+                                )
+                            
+                            total_records += len(processed)
+                            successful_combinations += 1
                         else:
-                            logger.warning("No data found for area=%s, land=%s", area, land)
+                            logger.warning("No processed data for area=%s, land=%s", area, land)
                             failed_combinations += 1
-                        
-                        logger.info("Completed area=%s, land=%s: %d records", area, land, len(combination_data))
+                    else:
+                        logger.warning("No data found for area=%s, land=%s", area, land)
+                        failed_combinations += 1
+                    
+                    logger.info("Completed area=%s, land=%s: %d records", area, land, len(combination_data))
+            
+            # Each queued batch is one combination: ones the database rejected did not succeed
+            if inserter.failed_batches:
+                successful_combinations -= inserter.failed_batches
+                failed_combinations += inserter.failed_batches
+                total_records -= inserter.failed_rows
+                raise RuntimeError(
+                    f"{inserter.failed_batches} combinations ({inserter.failed_rows} records) failed to insert "
+                    f"into the database; {successful_combinations} combinations ({total_records} records) were saved"
+                )
         
         except Exception as e:
             logger.error("Transaction history import failed: %s", e)
@@ -195,18 +238,18 @@ class TransactionHistoryImporter:
         
         # Final summary
         logger.info("Transaction history import completed")
-        logger.info("Total records processed: %d", len(transaction_history_data))
+        logger.info("Total records processed: %d", total_records)
         logger.info("Successful combinations: %d, Failed combinations: %d", 
                    successful_combinations, failed_combinations)
         
-        if not transaction_history_data:
+        if not total_records:
             logger.warning("No transaction history data retrieved.")
             return
 
         # Collect validation stats for final summary
         try:
-            if transaction_history_data:
-                stats = {"total": len(transaction_history_data), "processed": "during_import"}
+            if total_records:
+                stats = {"total": total_records, "processed": "during_import"}
                 logger.info("Final validation stats: %s", stats)
             else:
                 logger.warning("No processed data available for validation")
@@ -241,13 +284,15 @@ def main():
     parser.add_argument("--unit-min-size", type=float, help="Minimum unit size filter")
     parser.add_argument("--unit-max-size", type=float, help="Maximum unit size filter")
     parser.add_argument("--max-pages", type=int, default=10, help="Maximum pages per combination (default: 10)")
-    parser.add_argument("--request-delay", type=float, default=0.25, help="Delay between requests in seconds (default: 0.25)")
+    parser.add_argument("--request-delay", type=float, default=0.25, help="Average interval between requests in seconds (default: 0.25)")
+    parser.add_argument("--burst", type=int, default=1, help="Number of API requests allowed back-to-back before request-delay pacing applies (default: 1)")
+    parser.add_argument("--max-workers", type=int, default=4, help="Area/land combinations fetched concurrently (default: 4)")
     parser.add_argument("--dry-run", action="store_true", help="Don't save to database")
     
     args = parser.parse_args()
     
     # Create importer and run
-    importer = TransactionHistoryImporter()
+    importer = TransactionHistoryImporter(max_workers=args.max_workers)
     importer.process_transaction_history(
         country_code=args.country_code,
         municipal_property_type=args.municipal_property_type,
@@ -264,6 +309,7 @@ def main():
         unit_max_size=args.unit_max_size,
         max_pages=args.max_pages,
         request_delay=args.request_delay,
+        burst=args.burst,
         dry_run=args.dry_run
     )
 
@@ -51,9 +51,10 @@ class _RateLimiter:
 
 
 class TransactionListImporter:
-    def __init__(self):
+    def __init__(self, max_workers: int = 8):
         self.db = DatabaseManager()
-        self.api_client = ReidinAPIClient()
+        # Shared by all workers so connections are kept alive between requests
+        self.api_client = ReidinAPIClient(pool_maxsize=max_workers)
         self.processor = DataProcessor()
         
         # Create the transaction_list table if it doesn't exist
@@ -69,7 +70,7 @@ class TransactionListImporter:
         self.measurements = ["imp"]
         
         # Concurrency and rate limiting settings
-        self.max_workers = 8
+        self.max_workers = max_workers
         self.requests_per_second = 4.0
         self.min_interval_sec = 1.0 / self.requests_per_second
 
@@ -145,15 +146,14 @@ class TransactionListImporter:
 
         try:
             limiter.acquire()
-            with ReidinAPIClient() as client:
-                payload = client.fetch_transactions_list(
-                    country_code=country_code,
-                    location_id=location_id,
-                    property_type=param_set["property_type"],
-                    activity_type=param_set["activity_type"],
-                    currency=param_set["currency"],
-                    measurement=param_set["measurement"]
-                )
+            payload = self.api_client.fetch_transactions_list(
+                country_code=country_code,
+                location_id=location_id,
+                property_type=param_set["property_type"],
+                activity_type=param_set["activity_type"],
+                currency=param_set["currency"],
+                measurement=param_set["measurement"]
+            )
         except Exception as e:
             logger.warning(f"Failed to fetch data for params={param_set} location_id={location_id}: {e}")
             return 0
@@ -394,10 +394,9 @@ def main():
     args = parser.parse_args()
     
     try:
-        importer = TransactionListImporter()
+        importer = TransactionListImporter(max_workers=args.max_workers)
         
         # Override settings from command line
-        importer.max_workers = args.max_workers
         importer.requests_per_second = args.requests_per_second
         importer.min_interval_sec = 1.0 / args.requests_per_second
         
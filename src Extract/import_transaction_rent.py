@@ -277,7 +277,11 @@ class OptimizedTransactionRentImporter:
     def _get_resources(self):
         """Context manager for database and API client resources"""
         db = DatabaseManager()
-        api_client = ReidinAPIClient()
+        # Batches run in parallel and each fetches its locations in parallel too; keep one
+        # keep-alive connection per concurrent request instead of the default 10
+        api_client = ReidinAPIClient(
+            pool_maxsize=self.config.max_workers * self.config.template_parallel_workers
+        )
         try:
             # Table already exists in Azure database
             yield db, api_client
@@ -1,11 +1,13 @@
 import argparse
+import itertools
 import logging
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
 from queue import Queue, Empty
-from threading import Thread, Semaphore
+from threading import Thread
 from typing import Dict, List, Any, Optional
 
 # Ensure the parent directory is on sys.path when running this file directly
@@ -16,51 +18,56 @@ if str(PARENT_DIR) not in sys.path:
 from api_client import ReidinAPIClient
 from database import DatabaseManager
 from processors import DataProcessor
+from utils.queue_logging import configure_queue_logging
+from utils.rate_limiter import TokenBucket
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('transactions_avg_import.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
 class TransactionsAvgImporter:
-    def __init__(self, batch_size: int = 5000, max_workers: int = 8, request_delay: float = 1.0):
-        self.db = DatabaseManager()
-        self.api_client = ReidinAPIClient()
+    def __init__(self, batch_size: int = 20000, max_workers: int = 8, request_delay: float = 1.0, max_batch_bytes: int = 8 * 1024 * 1024, burst: int = 1):
+        self.db = DatabaseManager(synchronous_commit=False)
+        # One keep-alive connection per worker
+        self.api_client = ReidinAPIClient(pool_maxsize=max_workers)
         self.processor = DataProcessor()
         self.batch_size = batch_size
+        # Rows vary in size (raw_data dominates), so batches are also flushed by payload size
+        self.max_batch_bytes = max_batch_bytes
         self.max_workers = max_workers
+        self.max_in_flight = max_workers * 4
         self.request_delay = request_delay
         
-        # Asynchronous queue for decoupling API fetching from DB inserts (with backpressure)
-        self.data_queue = Queue(maxsize=200000)  # Increased for better throughput - prevents backpressure
-        
         # Flusher threads control (multiple flushers for better DB throughput)
         self.flusher_threads = []
         self.num_flushers = 6  # Increased for M3 Mac performance (6-8 flushers)
         
-        # Bounded semaphore for controlled task submission
-        self.task_semaphore = Semaphore(max_workers * 50)  # Balanced limit for sliding window
+        # Asynchronous queue for decoupling API fetching from DB inserts (with backpressure)
+        # Items are the record lists of one API response each. The bound is a few responses
+        # per flusher and in-flight task: when the flushers fall behind, workers block on
+        # put instead of piling up responses in memory.
+        self.data_queue = Queue(maxsize=self.num_flushers * self.max_in_flight)
         
-        # Global rate limiter for API calls (prevents 429 errors)
-        self.rate_limiter = Semaphore(1)  # Global rate limiting
-        self.last_request_time = 0
+        # Global rate limiter for API calls (prevents 429 errors): workers only wait for their
+        # own slot, so up to max_workers requests can be in flight at the average rate
+        self.rate_limiter = TokenBucket(rate=1.0 / request_delay if request_delay > 0 else 0, capacity=burst)
         
         # Statistics
         self.total_records_inserted = 0
         self.total_batches_flushed = 0
+        self.successful_tasks = 0
+        self.failed_tasks = 0
+        self.total_records_processed = 0
         
         # Parameter combinations for transactions average endpoint
-        self.property_types = ["Apartment", "Villa", "Office", "Serviced/Hotel Apartment"]
-        self.activity_types = ["sales", "off-plan", "mortgage", "off-plan-mortgage"]
-        self.currencies = ["aed"]
-        self.measurements = ["int"]
+        # (interned, so they are the same objects as the values read back for resume)
+        self.property_types = list(map(sys.intern, ["Apartment", "Villa", "Office", "Serviced/Hotel Apartment"]))
+        self.activity_types = list(map(sys.intern, ["sales", "off-plan", "mortgage", "off-plan-mortgage"]))
+        self.currencies = list(map(sys.intern, ["aed"]))
+        self.measurements = list(map(sys.intern, ["int"]))
+        # Parameter combinations are the same for every location, so build them once
+        self._combos = tuple(itertools.product(
+            self.property_types, self.activity_types, self.currencies, self.measurements
+        ))
 
     def start_flusher_threads(self):
         """Start multiple dedicated flusher threads for better DB throughput"""
@@ -83,6 +90,7 @@ class TransactionsAvgImporter:
     def _flusher_worker(self):
         """Worker thread that continuously flushes data to database"""
         batch = []
+        batch_bytes = 0
         batch_start_time = time.time()
         
         while True:
@@ -95,15 +103,18 @@ class TransactionsAvgImporter:
                     # Flush any remaining data before stopping
                     if batch:
                         self._flush_batch_to_db(batch)
-                    logger.info("✅ Flusher worker completed")
+                    logger.debug("✅ Flusher worker completed")
                     break
                 
-                batch.append(item)
+                batch.extend(item)
+                batch_bytes += sum(len(record.get("raw_data") or "") for record in item)
                 
-                # Flush batch when it reaches batch_size or after timeout
-                if len(batch) >= self.batch_size or (time.time() - batch_start_time) > 5.0:
+                # Flush batch when it reaches batch_size or max_batch_bytes, or after timeout
+                if (len(batch) >= self.batch_size or batch_bytes >= self.max_batch_bytes
+                        or (time.time() - batch_start_time) > 5.0):
                     self._flush_batch_to_db(batch)
                     batch = []
+                    batch_bytes = 0
                     batch_start_time = time.time()
                 
                 self.data_queue.task_done()
@@ -113,12 +124,14 @@ class TransactionsAvgImporter:
                 if batch:
                     self._flush_batch_to_db(batch)
                     batch = []
+                    batch_bytes = 0
                     batch_start_time = time.time()
             except Exception as e:
-                logger.error(f"Flusher worker error: {e}")
+                logger.error("Flusher worker error: %s", e)
                 if batch:
                     self._flush_batch_to_db(batch)
                     batch = []
+                    batch_bytes = 0
 
     def _flush_batch_to_db(self, batch: List[Dict[str, Any]]):
         """Flush a batch of records to the database"""
@@ -135,23 +148,32 @@ class TransactionsAvgImporter:
             elapsed = time.time() - start_time
             rate = len(batch) / elapsed if elapsed > 0 else 0
             
-            logger.info(f"✅ Successfully inserted {len(batch)} records in {elapsed:.2f}s ({rate:.1f} rec/s) (Total: {self.total_records_inserted} records, {self.total_batches_flushed} batches)")
+            logger.info(
+                "✅ Successfully inserted %d records in %.2fs (%.1f rec/s) (Total: %d records, %d batches)",
+                len(batch), elapsed, rate, self.total_records_inserted, self.total_batches_flushed
+            )
             
         except Exception as e:
-            logger.error(f"Failed to flush batch to database: {e}")
+            logger.error("Failed to flush batch to database: %s", e)
 
     def _rate_limited_request(self, func, *args, **kwargs):
         """Make a rate-limited API request"""
-        with self.rate_limiter:
-            current_time = time.time()
-            time_since_last = current_time - self.last_request_time
-            
-            if time_since_last < self.request_delay:
-                sleep_time = self.request_delay - time_since_last
-                time.sleep(sleep_time)
-            
-            self.last_request_time = time.time()
-            return func(*args, **kwargs)
+        self.rate_limiter.acquire()
+        return func(*args, **kwargs)
+
+    def _collect_result(self, future, total_tasks: int) -> None:
+        """Record the outcome of one completed location task and log progress periodically"""
+        try:
+            self.total_records_processed += future.result()
+            self.successful_tasks += 1
+        except Exception as e:
+            logger.error("Task failed: %s", e)
+            self.failed_tasks += 1
+        
+        completed = self.successful_tasks + self.failed_tasks
+        if completed % 40 == 0 or completed == total_tasks:
+            logger.info("📊 Progress: %d/%d locations processed", completed, total_tasks)
+            logger.info("📊 Queue size: %d", self.data_queue.qsize())
 
     def get_locations(self, country_code: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
         """Get locations from the database with optional offset for batch processing"""
@@ -163,93 +185,98 @@ class TransactionsAvgImporter:
             logger.error(f"Failed to get locations: {e}")
             return []
 
-    def get_processed_location_combinations(self) -> set:
-        """Get set of location/parameter combinations that have already been processed (for resume capability)"""
+    def get_processed_location_combinations(self, location_ids: List[int]) -> Dict[int, set]:
+        """Get the parameter combinations already processed for each of the given locations (for resume capability)
+        
+        Returns {location_id: {(property_type, activity_type, currency, measurement, no_of_bedrooms), ...}}.
+        Rows are streamed from a server-side cursor instead of being fetched all at once.
+        """
+        processed_by_location = defaultdict(set)
         try:
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cur:
+            with self.db.pooled_connection() as conn:
+                with conn.cursor(name="processed_location_combinations") as cur:
+                    cur.itersize = 10000
                     # Check for location/parameter combinations that have been processed
                     # Note: no_of_bedrooms is NULL in our current implementation
+                    # Only the configured parameter values can match a combination
                     cur.execute('''
                         SELECT DISTINCT location_id, property_type, activity_type, currency, measurement, no_of_bedrooms
                         FROM transactions_avg 
-                        WHERE location_id IS NOT NULL
-                    ''')
-                    processed_combinations = {tuple(row) for row in cur.fetchall()}
-                    logger.info(f"Found {len(processed_combinations)} already processed location/parameter combinations")
-                    return processed_combinations
+                        WHERE location_id = ANY(%s)
+                          AND property_type = ANY(%s) AND activity_type = ANY(%s)
+                          AND currency = ANY(%s) AND measurement = ANY(%s)
+                    ''', (list(location_ids), self.property_types, self.activity_types,
+                          self.currencies, self.measurements))
+                    # Each row brings fresh copies of the same few strings; interning shares
+                    # them across all keys and lets set lookups match on identity
+                    intern = sys.intern
+                    for location_id, property_type, activity_type, currency, measurement, no_of_bedrooms in cur:
+                        processed_by_location[location_id].add((
+                            intern(property_type), intern(activity_type),
+                            intern(currency), intern(measurement), no_of_bedrooms
+                        ))
+            logger.info(f"Found {sum(map(len, processed_by_location.values()))} already processed location/parameter combinations")
         except Exception as e:
             logger.error(f"Failed to get processed location combinations: {e}")
-            return set()
+        return processed_by_location
 
     def process_single_location(self, location_data: Dict[str, Any], max_combinations_per_location: int = 10, processed_combinations: set = None) -> int:
-        """Process a single location with all parameter combinations"""
+        """Process a single location with all parameter combinations
+        
+        processed_combinations holds this location's already processed
+        (property_type, activity_type, currency, measurement, no_of_bedrooms) tuples.
+        """
         location_id = location_data['location_id']
         records_processed = 0
-        combinations_tried = 0
         
         if processed_combinations is None:
             processed_combinations = set()
         
-        # Generate all combinations of parameters
-        for property_type in self.property_types:
-            for activity_type in self.activity_types:
-                for currency in self.currencies:
-                    for measurement in self.measurements:
-                        if combinations_tried >= max_combinations_per_location:
-                            break
-                        
-                        # Check if this specific combination has already been processed
-                        combination_key = (location_id, property_type, activity_type, currency, measurement, None)  # None for no_of_bedrooms
-                        if combination_key in processed_combinations:
-                            logger.debug(f"Skipping already processed combination: {location_id}/{property_type}/{activity_type}/{currency}/{measurement}")
-                            combinations_tried += 1
-                            continue
-                        
-                        try:
-                            # Build parameters for the API call
-                            params = {
-                                "property_type": property_type,
-                                "activity_type": activity_type,
-                                "currency": currency,
-                                "measurement": measurement,
-                                "location_id": str(location_id),
-                            }
+        # The first max_combinations_per_location parameter combinations, in a fixed order
+        for property_type, activity_type, currency, measurement in self._combos[:max_combinations_per_location]:
+            # Check if this specific combination has already been processed
+            combination_key = (property_type, activity_type, currency, measurement, None)  # None for no_of_bedrooms
+            if combination_key in processed_combinations:
+                logger.debug("Skipping already processed combination: %s/%s/%s/%s/%s", location_id, property_type, activity_type, currency, measurement)
+                continue
+            
+            try:
+                # Build parameters for the API call
+                params = {
+                    "property_type": property_type,
+                    "activity_type": activity_type,
+                    "currency": currency,
+                    "measurement": measurement,
+                    "location_id": str(location_id),
+                }
 
-                            # Make rate-limited API call
-                            response_data = self._rate_limited_request(
-                                self.api_client.fetch_transactions_avg,
-                                "AE",  # country_code
-                                params
-                            )
-                            
-                            if response_data and isinstance(response_data, dict) and "results" in response_data:
-                                # Process the response data
-                                processed_records = self.processor.process_transactions_avg_data(
-                                    response_data.get("results", []),
-                                    location_id=location_id,
-                                    property_type=property_type,
-                                    activity_type=activity_type,
-                                    currency=currency,
-                                    measurement=measurement
-                                )
-                                
-                                # Add processed records to queue
-                                for record in processed_records:
-                                    self.data_queue.put(record)
-                                
-                                records_processed += len(processed_records)
-                            
-                            combinations_tried += 1
-                            
-                        except Exception as e:
-                            logger.warning(f"Failed to process location {location_id} with combination {property_type}/{activity_type}/{currency}/{measurement}: {e}")
-                            combinations_tried += 1
-                            continue
-                if combinations_tried >= max_combinations_per_location:
-                    break
-            if combinations_tried >= max_combinations_per_location:
-                break
+                # Make rate-limited API call
+                response_data = self._rate_limited_request(
+                    self.api_client.fetch_transactions_avg,
+                    "AE",  # country_code
+                    params
+                )
+                
+                if response_data and isinstance(response_data, dict) and "results" in response_data:
+                    # Process the response data
+                    processed_records = self.processor.process_transactions_avg_data(
+                        response_data.get("results", []),
+                        location_id=location_id,
+                        property_type=property_type,
+                        activity_type=activity_type,
+                        currency=currency,
+                        measurement=measurement
+                    )
+                    
+                    # Add the response's records to the queue as one item
+                    if processed_records:
+                        self.data_queue.put(processed_records)
+                    
+                    records_processed += len(processed_records)
+                
+            except Exception as e:
+                logger.warning("Failed to process location %s with combination %s/%s/%s/%s: %s", location_id, property_type, activity_type, currency, measurement, e)
+                continue
         
         return records_processed
 
@@ -267,9 +294,9 @@ class TransactionsAvgImporter:
         logger.info(f"Max locations: {max_locations}")
         logger.info(f"Offset: {offset}")
         logger.info(f"Max combinations per location: {max_combinations_per_location}")
-        logger.info(f"Batch size: {self.batch_size}")
+        logger.info(f"Batch size: {self.batch_size} rows / {self.max_batch_bytes / 1024 / 1024:.1f} MB")
         logger.info(f"Max workers: {self.max_workers}")
-        logger.info(f"Request delay: {self.request_delay}s")
+        logger.info(f"Rate limit: {self.rate_limiter.rate:.2f} req/s (burst {self.rate_limiter.capacity})")
         logger.info(f"Dry run: {dry_run}")
         
         if dry_run:
@@ -283,18 +310,18 @@ class TransactionsAvgImporter:
             return
         
         # Get already processed location combinations for resume capability
-        processed_combinations = self.get_processed_location_combinations()
+        processed_by_location = self.get_processed_location_combinations(
+            [location['location_id'] for location in locations]
+        )
         
         # Filter out already processed location/parameter combinations
         remaining_locations = []
-        total_combinations = len(self.property_types) * len(self.activity_types) * len(self.currencies) * len(self.measurements)
+        total_combinations = len(self._combos)
         
         for location in locations:
             location_id = location['location_id']
             # Check how many combinations have been processed for this location
-            location_combinations = [combo for combo in processed_combinations if combo[0] == location_id]
-            
-            if len(location_combinations) < total_combinations:
+            if len(processed_by_location.get(location_id, ())) < total_combinations:
                 # This location still has unprocessed combinations
                 remaining_locations.append(location)
         
@@ -302,7 +329,7 @@ class TransactionsAvgImporter:
             logger.info("✅ All locations have already been processed with all parameter combinations")
             return
 
-        total_processed_combinations = sum(len([combo for combo in processed_combinations if combo[0] == loc['location_id']]) for loc in locations)
+        total_processed_combinations = sum(len(processed_by_location.get(loc['location_id'], ())) for loc in locations)
         total_possible_combinations = len(locations) * total_combinations
         
         logger.info(f"🔄 Resume mode: {total_processed_combinations}/{total_possible_combinations} combinations already processed")
@@ -315,44 +342,32 @@ class TransactionsAvgImporter:
             # Process locations in parallel
             logger.info(f"🔄 Starting parallel API processing with {self.max_workers} workers...")
             
-            total_records = 0
-            successful_tasks = 0
-            failed_tasks = 0
+            self.successful_tasks = 0
+            self.failed_tasks = 0
+            self.total_records_processed = 0
+            total_tasks = len(remaining_locations)
             
-            # Process in batches to control memory usage
-            batch_size = min(40, len(remaining_locations))  # Max 40 futures per batch
-            
-            for i in range(0, len(remaining_locations), batch_size):
-                batch = remaining_locations[i:i + batch_size]
-                logger.info(f"📦 Processing batch {i//batch_size + 1}/{(len(remaining_locations) + batch_size - 1)//batch_size} ({len(batch)} locations)")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Submit while completing: only max_in_flight futures exist at any time, so
+                # workers never idle waiting for the slowest location of a batch. Workers
+                # block on the bounded data_queue when the flushers fall behind.
+                logger.info(f"📦 Processing {total_tasks} locations (max {self.max_in_flight} futures in flight)")
+                in_flight = set()
+                for location_data in remaining_locations:
+                    in_flight.add(executor.submit(
+                        self.process_single_location, 
+                        location_data, 
+                        max_combinations_per_location,
+                        processed_by_location.get(location_data['location_id'], set())
+                    ))
+                    if len(in_flight) >= self.max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._collect_result(future, total_tasks)
                 
-                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    # Submit tasks with semaphore control
-                    futures = []
-                    for location_data in batch:
-                        with self.task_semaphore:
-                            future = executor.submit(
-                                self.process_single_location, 
-                                location_data, 
-                                max_combinations_per_location,
-                                processed_combinations
-                            )
-                            futures.append(future)
-                    
-                    # Process completed tasks
-                    for future in as_completed(futures):
-                        try:
-                            records = future.result()
-                            total_records += records
-                            successful_tasks += 1
-                        except Exception as e:
-                            logger.error(f"Task failed: {e}")
-                            failed_tasks += 1
-                    
-                    # Log progress
-                processed_so_far = min(i + batch_size, len(remaining_locations))
-                logger.info(f"📊 Progress: {processed_so_far}/{len(remaining_locations)} locations processed")
-                logger.info(f"📊 Queue size: {self.data_queue.qsize()}")
+                # Drain the remaining futures
+                for future in as_completed(in_flight):
+                    self._collect_result(future, total_tasks)
             
             # Wait for all data to be flushed
             logger.info("🔄 Stopping flusher thread and waiting for final flush...")
@@ -360,10 +375,10 @@ class TransactionsAvgImporter:
             
             # Final statistics
             logger.info("🎉 Transactions Average import completed!")
-            logger.info(f"Total API tasks: {successful_tasks + failed_tasks}")
-            logger.info(f"Successful tasks: {successful_tasks}")
-            logger.info(f"Failed tasks: {failed_tasks}")
-            logger.info(f"Total records processed: {total_records}")
+            logger.info(f"Total API tasks: {self.successful_tasks + self.failed_tasks}")
+            logger.info(f"Successful tasks: {self.successful_tasks}")
+            logger.info(f"Failed tasks: {self.failed_tasks}")
+            logger.info(f"Total records processed: {self.total_records_processed}")
             logger.info(f"Total records inserted: {self.total_records_inserted}")
             logger.info(f"Total batches flushed: {self.total_batches_flushed}")
             logger.info(f"Average records per batch: {self.total_records_inserted / max(1, self.total_batches_flushed):.1f}")
@@ -397,11 +412,23 @@ def main():
         default=0.25, 
         help="Delay between API requests in seconds (default: 0.25)"
     )
+    parser.add_argument(
+        "--burst", 
+        type=int, 
+        default=1, 
+        help="Number of API requests allowed back-to-back before request-delay pacing applies (default: 1)"
+    )
     parser.add_argument(
         "--batch-size", 
         type=int, 
-        default=5000, 
-        help="Database batch size (default: 5000)"
+        default=20000, 
+        help="Database batch size (default: 20000)"
+    )
+    parser.add_argument(
+        "--max-batch-mb", 
+        type=float, 
+        default=8.0, 
+        help="Flush a database batch once its raw payload reaches this many MB (default: 8)"
     )
     parser.add_argument(
         "--max-workers", 
@@ -429,11 +456,19 @@ def main():
     
     args = parser.parse_args()
 
+    # Log records are written by a listener thread, so file I/O stays off the workers and flushers
+    configure_queue_logging([
+        logging.StreamHandler(),
+        logging.FileHandler('transactions_avg_import.log')
+    ])
+
     # Create importer and run
     importer = TransactionsAvgImporter(
         batch_size=args.batch_size,
         max_workers=args.max_workers,
-        request_delay=args.request_delay
+        request_delay=args.request_delay,
+        burst=args.burst,
+        max_batch_bytes=int(args.max_batch_mb * 1024 * 1024)
     )
 
     try:
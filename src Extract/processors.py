@@ -1,15 +1,69 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, NamedTuple
+from datetime import datetime
 import json
+from utils import fast_json
 
 logger = logging.getLogger(__name__)
 
 
+def _to_float(value: Any) -> float | None:
+    """Convert an API value to float, None if it is missing or not numeric"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_int(value: Any) -> int | None:
+    """Convert an API value to int, None if it is missing or not numeric"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+class CMASalesRecord(NamedTuple):
+    """A processed CMA sales row; field order matches the cma_sales INSERT column order"""
+    property_id: int
+    alias: str
+    currency: str
+    measurement: str
+    property_type: str
+    property_subtype: str
+    comparable_property_id: int
+    comparable_property_name: str | None
+    size: float | None
+    price: float | None
+    price_per_size: float | None
+    transaction_date: datetime | None
+    city_id: int | None
+    city_name: str | None
+    county_id: int | None
+    county_name: str | None
+    district_id: int | None
+    district_name: str | None
+    location_id: int | None
+    location_name: str | None
+    municipal_area: str | None
+    activity_type: str | None
+    no_of_bedrooms: int | None
+    number_of_unit: str | None
+    property_nature: str | None
+    number_of_floors: str | None
+    parent_property: Dict[str, Any] | None
+    raw_data: Dict[str, Any] | None
+
+
 class DataProcessor:
     @staticmethod
     def jsonify_data(data: Any | None) -> str | None:
-        """JSONify data"""
-        return json.dumps(data) if data else None
+        """JSONify data (orjson when installed)"""
+        return fast_json.dumps(data) if data else None
 
     @staticmethod
     def process_location_data(raw_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -118,7 +172,7 @@ class DataProcessor:
                         "import_type": source_data.get("import_type"),
                         "dld_status": source_data.get("dld_status"),
                         "elapsed_time_status": source_data.get("elapsed_time_status"),
-                        "raw_data": json.dumps(item),
+                        "raw_data": fast_json.dumps(item),
                     }
                 )
             except Exception as e:
@@ -131,73 +185,68 @@ class DataProcessor:
     def process_property_details_data(
         raw_data: Dict[str, Any] | List[Dict[str, Any]],
     ) -> List[Dict[str, Any]]:
-        """Process property details data from property/{property_id} endpoint"""
-        processed: List[Dict[str, Any]] = []
-
-        # Handle case where raw_data might be an array (should always have one item)
-        if isinstance(raw_data, list):
-            if len(raw_data) > 0:
-                raw_data = raw_data[0]  # Extract the first (and only) item
-            else:
-                logger.warning("Empty list received for property details")
-                return processed
+        """Process property details data from property/{property_id} endpoint
 
-        location = raw_data.get("location")
+        Accepts a single property object or a list of them (the endpoint's
+        one-item response, or a whole batch of responses).
+        """
+        processed: List[Dict[str, Any]] = []
 
-        # Property details endpoint returns single property object
         if isinstance(raw_data, dict):
+            raw_data = [raw_data]
+        elif not raw_data:
+            logger.warning("Empty list received for property details")
+            return processed
+
+        jsonify = DataProcessor.jsonify_data
+        append = processed.append
+        for item in raw_data:
+            # Property details endpoint returns single property objects
+            if not isinstance(item, dict):
+                continue
+            location = item.get("location")
             try:
-                processed.append(
+                append(
                     {
-                        "id": raw_data.get("id"),
-                        "property_id": raw_data.get("id"),
-                        "name": raw_data.get("name"),
-                        "name_local": raw_data.get("name_local"),
-                        "description": raw_data.get("description"),
-                        "description_local": raw_data.get("description_local"),
-                        "developer_prices": DataProcessor.jsonify_data(
-                            raw_data.get("developer_prices")
-                        ),
-                        "parties": DataProcessor.jsonify_data(raw_data.get("parties")),
-                        "images": DataProcessor.jsonify_data(raw_data.get("images")),
-                        "units": DataProcessor.jsonify_data(raw_data.get("units")),
-                        "attributes": DataProcessor.jsonify_data(
-                            raw_data.get("attributes")
-                        ),
-                        "level": DataProcessor.jsonify_data(raw_data.get("level")),
-                        "geo_point": DataProcessor.jsonify_data(
-                            raw_data.get("geo_point")
-                        ),
-                        "loc_point": DataProcessor.jsonify_data(
-                            raw_data.get("loc_point")
-                        ),
+                        "id": item.get("id"),
+                        "property_id": item.get("id"),
+                        "name": item.get("name"),
+                        "name_local": item.get("name_local"),
+                        "description": item.get("description"),
+                        "description_local": item.get("description_local"),
+                        "developer_prices": jsonify(item.get("developer_prices")),
+                        "parties": jsonify(item.get("parties")),
+                        "images": jsonify(item.get("images")),
+                        "units": jsonify(item.get("units")),
+                        "attributes": jsonify(item.get("attributes")),
+                        "level": jsonify(item.get("level")),
+                        "geo_point": jsonify(item.get("geo_point")),
+                        "loc_point": jsonify(item.get("loc_point")),
                         "location_id": location.get("id") if location else None,
-                        "location": DataProcessor.jsonify_data(location),
-                        "locations": DataProcessor.jsonify_data(
-                            raw_data.get("locations")
-                        ),
-                        "parent_id": raw_data.get("parent_id"),
-                        "parent_ids": raw_data.get("parent_ids"),
-                        "parents": DataProcessor.jsonify_data(raw_data.get("parents")),
-                        "primary_image": raw_data.get("primary_image"),
-                        "search_terms": raw_data.get("search_terms"),
-                        "status": DataProcessor.jsonify_data(raw_data.get("status")),
-                        "types": DataProcessor.jsonify_data(raw_data.get("types")),
-                        "elapsed_time_status": raw_data.get("elapsed_time_status"),
-                        "dld_status": raw_data.get("dld_status"),
-                        "updated_on": raw_data.get("updated_on"),
-                        "gla": raw_data.get("gla"),
-                        "office_gla": raw_data.get("office_gla"),
-                        "typical_gla_floor": raw_data.get("typical_gla_floor"),
-                        "built_up_area": raw_data.get("built_up_area"),
-                        "building_height": raw_data.get("building_height"),
-                        "land_area": raw_data.get("land_area"),
-                        "raw_data": json.dumps(raw_data),
+                        "location": jsonify(location),
+                        "locations": jsonify(item.get("locations")),
+                        "parent_id": item.get("parent_id"),
+                        "parent_ids": item.get("parent_ids"),
+                        "parents": jsonify(item.get("parents")),
+                        "primary_image": item.get("primary_image"),
+                        "search_terms": item.get("search_terms"),
+                        "status": jsonify(item.get("status")),
+                        "types": jsonify(item.get("types")),
+                        "elapsed_time_status": item.get("elapsed_time_status"),
+                        "dld_status": item.get("dld_status"),
+                        "updated_on": item.get("updated_on"),
+                        "gla": item.get("gla"),
+                        "office_gla": item.get("office_gla"),
+                        "typical_gla_floor": item.get("typical_gla_floor"),
+                        "built_up_area": item.get("built_up_area"),
+                        "building_height": item.get("building_height"),
+                        "land_area": item.get("land_area"),
+                        "raw_data": fast_json.dumps(item),
                     }
                 )
             except Exception as e:
                 logger.warning("Failed to process property details record: %s", e)
-                logger.debug("Problematic item: %s", raw_data)
+                logger.debug("Problematic item: %s", item)
         return processed
 
     @staticmethod
@@ -263,6 +312,15 @@ class DataProcessor:
         processed = []
         logger.info("Processing transactions average data for location %s: %s records", location_id, len(raw_data))
 
+        # Fields shared by every record of this call, copied into each record below
+        template = {
+            "location_id": location_id,
+            "property_type": property_type,
+            "activity_type": activity_type,
+            "currency": currency,
+            "measurement": measurement,
+        }
+
         for item in raw_data:
             try:
                 # Extract location name if available
@@ -303,12 +361,8 @@ class DataProcessor:
                         
                         # Create normalized record
                         processed_item = {
-                            "location_id": location_id,
+                            **template,
                             "location_name": location_name,
-                            "property_type": property_type,
-                            "activity_type": activity_type,
-                            "currency": currency,
-                            "measurement": measurement,
                             "no_of_bedrooms": no_of_bedrooms,
                             "date_period": date_period,
                             "year": year,
@@ -319,7 +373,7 @@ class DataProcessor:
                             "total_price": total_price,
                             "price_per_sqm": price_per_sqm,
                             "transaction_volume": transaction_volume,
-                            "raw_data": json.dumps(value_item)
+                            "raw_data": fast_json.dumps(value_item)
                         }
                         
                         processed.append(processed_item)
@@ -719,15 +773,18 @@ class DataProcessor:
         currency: str,
         measurement: str,
         property_type: str,
-        property_subtype: str,
+        property_subtype: str | None,
         no_of_bedrooms: int | None = None,
         size: str | None = None,
         sales_activity_type: str | None = None,
         lat: str | None = None,
-        lon: str | None = None
-    ) -> List[Dict[str, Any]]:
+        lon: str | None = None,
+        keep_raw: bool = False
+    ) -> List[CMASalesRecord]:
         """
-        Process CMA sales data from API response based on the sample structure:
+        Process CMA sales data into CMASalesRecord tuples (raw_data is only kept when keep_raw is set).
+        A property_subtype of None takes the subtype from each item (combined subtype requests).
+        Based on the sample API response structure:
         {
             "size": 5746.25, 
             "price": 3100000, 
@@ -757,144 +814,118 @@ class DataProcessor:
         }
         """
         processed_records = []
-        seen_keys = set()  # For deduplication
+        append = processed_records.append
+        # The other query parameters are fixed for the whole response, so the comparable
+        # property id identifies a row within it; without a requested subtype
+        # (--batch-subtypes) each record carries its own, which is part of the unique key
+        seen_keys: set = set()  # For deduplication
+        seen_add = seen_keys.add
+        key_by_subtype = not property_subtype
+        
+        # Bind hot helpers and loop invariants as locals
+        to_float = _to_float
+        to_int = _to_int
+        fromisoformat = datetime.fromisoformat
+        empty = {}
+        query_property_id = int(property_id)
         
         for item in raw_data:
+            if not isinstance(item, dict):
+                continue
+            get = item.get
+            
+            # The CMA sales API returns actual property transaction records
+            # Each record represents a comparable property transaction
+            comparable_property_id = get("property_id")
+            if not comparable_property_id:
+                logger.warning(f"No property_id found in CMA sales record: {item}")
+                continue
+            
+            item_subtype = property_subtype or get("property_subtype")
+            if not item_subtype:
+                logger.warning(f"No property_subtype found in CMA sales record: {item}")
+                continue
+            
             try:
-                if not isinstance(item, dict):
-                    continue
-                
-                # The CMA sales API returns actual property transaction records
-                # Each record represents a comparable property transaction
-                comparable_property_id = item.get("property_id")
-                if not comparable_property_id:
-                    logger.warning(f"No property_id found in CMA sales record: {item}")
-                    continue
-                
-                # Create unique key for deduplication based on the comparable property
-                unique_key = (int(property_id), alias, currency, measurement, property_type, property_subtype, int(comparable_property_id))
-                
-                if unique_key in seen_keys:
-                    continue  # Skip duplicate
-                
-                seen_keys.add(unique_key)
-                
-                # Extract and convert numeric values with proper type handling
-                size_value = item.get("size")
-                price_value = item.get("price")
-                price_per_size_value = item.get("price_per_size")
-                
-                # Convert size to decimal
-                try:
-                    if size_value is not None:
-                        size_value = float(size_value)
-                    else:
-                        size_value = None
-                except (ValueError, TypeError):
-                    size_value = None
-                
-                # Convert price to decimal
-                try:
-                    if price_value is not None:
-                        price_value = float(price_value)
-                    else:
-                        price_value = None
-                except (ValueError, TypeError):
-                    price_value = None
-                
-                # Convert price_per_size to decimal
+                comparable_property_id = int(comparable_property_id)
+            except (ValueError, TypeError, OverflowError):
+                logger.warning(f"Invalid property_id in CMA sales record: {comparable_property_id!r}")
+                continue
+            key = (item_subtype, comparable_property_id) if key_by_subtype else comparable_property_id
+            if key in seen_keys:
+                continue  # Skip duplicate
+            seen_add(key)
+            
+            # Parse transaction date
+            transaction_date_str = get("transaction_date")
+            transaction_date = None
+            if transaction_date_str:
                 try:
-                    if price_per_size_value is not None:
-                        price_per_size_value = float(price_per_size_value)
-                    else:
-                        price_per_size_value = None
-                except (ValueError, TypeError):
-                    price_per_size_value = None
+                    # Handle ISO format with Z suffix
+                    if transaction_date_str.endswith('Z'):
+                        transaction_date_str = transaction_date_str[:-1] + '+00:00'
+                    transaction_date = fromisoformat(transaction_date_str)
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"Failed to parse transaction_date '{transaction_date_str}': {e}")
+            
+            # Extract location information (flatten nested location object)
+            location = get("location") or empty
+            if not isinstance(location, dict):
+                location = empty
+            loc = location.get
+            
+            # Extract parent property information
+            parent_property = get("parent_property") or None
+            if not isinstance(parent_property, dict):
+                parent_property = None
+            
+            processed_record = CMASalesRecord(
+                # Property information (the property we're getting CMA for)
+                query_property_id,
                 
-                # Parse transaction date
-                transaction_date_str = item.get("transaction_date")
-                transaction_date = None
-                if transaction_date_str:
-                    try:
-                        from datetime import datetime
-                        # Handle ISO format with Z suffix
-                        if transaction_date_str.endswith('Z'):
-                            transaction_date_str = transaction_date_str[:-1] + '+00:00'
-                        transaction_date = datetime.fromisoformat(transaction_date_str)
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Failed to parse transaction_date '{transaction_date_str}': {e}")
-                        transaction_date = None
+                # CMA parameters used in the query
+                alias,
+                currency,
+                measurement,
+                property_type,
+                item_subtype,
                 
-                # Extract location information (flatten nested location object)
-                location = item.get("location", {})
-                if not isinstance(location, dict):
-                    location = {}
+                # Comparable property information (from the API response)
+                comparable_property_id,
+                get("property_name"),
                 
-                # Extract parent property information
-                parent_property = item.get("parent_property", {})
-                if not isinstance(parent_property, dict):
-                    parent_property = {}
+                # Transaction details from comparable property
+                to_float(get("size")),
+                to_float(get("price")),
+                to_float(get("price_per_size")),
+                transaction_date,
                 
-                # Extract no_of_bedrooms from the item (not from parameters)
-                item_no_of_bedrooms = item.get("no_of_bedrooms")
-                if item_no_of_bedrooms is not None:
-                    try:
-                        item_no_of_bedrooms = int(item_no_of_bedrooms)
-                    except (ValueError, TypeError):
-                        item_no_of_bedrooms = None
+                # Location information (flattened from nested location object)
+                loc("city_id"),
+                loc("city_name"),
+                loc("county_id"),
+                loc("county_name"),
+                loc("district_id"),
+                loc("district_name"),
+                loc("location_id"),
+                loc("location_name"),
+                loc("municipal_area"),
                 
-                processed_record = {
-                    # Property information (the property we're getting CMA for)
-                    "property_id": int(property_id),
-                    
-                    # CMA parameters used in the query
-                    "alias": alias,
-                    "currency": currency,
-                    "measurement": measurement,
-                    "property_type": property_type,
-                    "property_subtype": property_subtype,
-                    
-                    # Comparable property information (from the API response)
-                    "comparable_property_id": int(comparable_property_id),
-                    "comparable_property_name": item.get("property_name"),
-                    
-                    # Transaction details from comparable property
-                    "size": size_value,
-                    "price": price_value,
-                    "price_per_size": price_per_size_value,
-                    "transaction_date": transaction_date,
-                    
-                    # Location information (flattened from nested location object)
-                    "city_id": location.get("city_id"),
-                    "city_name": location.get("city_name"),
-                    "county_id": location.get("county_id"),
-                    "county_name": location.get("county_name"),
-                    "district_id": location.get("district_id"),
-                    "district_name": location.get("district_name"),
-                    "location_id": location.get("location_id"),
-                    "location_name": location.get("location_name"),
-                    "municipal_area": location.get("municipal_area"),
-                    
-                    # Property attributes
-                    "activity_type": item.get("activity_type"),
-                    "no_of_bedrooms": item_no_of_bedrooms,
-                    "number_of_unit": item.get("number_of_unit"),
-                    "property_nature": item.get("property_nature"),
-                    "number_of_floors": item.get("number_of_floors"),
-                    
-                    # Parent property information (if applicable)
-                    "parent_property": parent_property,
-                    
-                    # Raw data for reference (complete API response)
-                    "raw_data": item
-                }
+                # Property attributes (no_of_bedrooms from the item, not from parameters)
+                get("activity_type"),
+                to_int(get("no_of_bedrooms")),
+                get("number_of_unit"),
+                get("property_nature"),
+                get("number_of_floors"),
                 
-                processed_records.append(processed_record)
+                # Parent property information (if applicable)
+                parent_property,
                 
-            except Exception as e:
-                logger.error(f"Failed to process CMA sales record: {e}")
-                logger.debug(f"Problematic item: {item}")
-                continue
+                # Raw data for reference (complete API response), only on request
+                item if keep_raw else None
+            )
+            
+            append(processed_record)
         
         logger.info(f"Processed {len(processed_records)} CMA sales records from {len(raw_data)} raw records (deduplicated from {len(raw_data)})")
         return processed_records
@@ -0,0 +1,169 @@
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from processors import DataProcessor
+from utils.buffered_inserter import BufferedInserter
+from utils.queue_logging import forward_worker_logs, init_worker_logging
+
+logger = logging.getLogger(__name__)
+
+Rows = List[Dict[str, Any]]
+
+
+def _queue_processed_batch(
+    batch_num: int,
+    future: "Future[Rows]",
+    inserter: BufferedInserter,
+    stats: Dict[str, int],
+    dry_run: bool,
+    row_label: str,
+) -> None:
+    """Wait for a batch's processing result, add its stats and queue it for the database."""
+    try:
+        processed = future.result()
+        for name, value in DataProcessor.validate_data_quality(processed).items():
+            stats[name] += value
+
+        if processed:
+            if not dry_run:
+                inserter.submit(processed)
+                logger.info("Queued batch %d for database: %d %s", batch_num, len(processed), row_label)
+            else:
+                logger.info(
+                    "Dry run: would save batch %d to database: %d %s", batch_num, len(processed), row_label
+                )
+        else:
+            logger.warning("Batch %d produced no processed data", batch_num)
+
+    except Exception as e:
+        logger.error("Failed to save batch %d to database: %s", batch_num, e)
+        # Continue with next batch even if this one failed to save
+
+
+def run_batch_pipeline(
+    batches: Iterable[List[Any]],
+    fetch_fn: Callable[[Any], Optional[Rows]],
+    process_fn: Callable[[Rows], Rows],
+    insert_fn: Callable[[Rows], None],
+    name: str,
+    max_workers: int = 8,
+    process_workers: int = 1,
+    dry_run: bool = False,
+    item_label: str = "items",
+    row_label: str = "rows",
+) -> Dict[str, int]:
+    """Fetch, process and store batches of API requests, overlapping the three stages.
+
+    The items of a batch are passed to ``fetch_fn`` concurrently on ``max_workers``
+    threads; ``fetch_fn`` returns the raw rows of one item, or None if it failed. While
+    the next batch is fetched, the raw rows of the previous one go through ``process_fn``
+    in one of ``process_workers`` worker processes (only one batch is processed at a
+    time), and the processed rows are written by a ``BufferedInserter`` around
+    ``insert_fn``. ``process_fn`` must be picklable (a module-level or static
+    function), as worker processes are spawned, not forked, while threads are running;
+    their log records are forwarded to this process's handlers.
+
+    Returns the validation stats of the processed rows, summed over all batches, plus
+    ``failed_rows``: processed rows the database rejected.
+    """
+    stats = {"total": 0, "missing": 0, "failed_rows": 0}
+    grand_successful = 0
+    grand_failed = 0
+    total_rows = 0
+
+    batches = iter(batches)
+    batch_items = next(batches, None)
+    if not batch_items:
+        return stats
+
+    mp_context = multiprocessing.get_context("spawn")
+    with forward_worker_logs(mp_context) as log_queue, \
+            ProcessPoolExecutor(
+                max_workers=process_workers,
+                mp_context=mp_context,
+                initializer=init_worker_logging,
+                initargs=(log_queue, logging.getLogger().getEffectiveLevel()),
+            ) as process_pool, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            BufferedInserter(insert_fn, name=name) as inserter:
+        fetches = executor.map(fetch_fn, batch_items)
+        pending: Optional[Tuple[int, "Future[Rows]"]] = None  # the batch being processed
+        batch_num = 0
+        start_idx = 0
+        while batch_items:
+            batch_num += 1
+            end_idx = start_idx + len(batch_items)
+
+            logger.info(
+                "Processing batch %d: %d %s %d-%d",
+                batch_num,
+                len(batch_items),
+                item_label,
+                start_idx + 1,
+                end_idx,
+            )
+
+            batch_rows = []
+            successful = 0
+            failed = 0
+
+            # The batch's items are fetched concurrently (results come back in input order)
+            for rows in fetches:
+                if rows is None:
+                    failed += 1
+                    continue
+                batch_rows.extend(rows)
+                successful += 1
+            grand_successful += successful
+            grand_failed += failed
+
+            # Start fetching the next batch while this one is processed and queued
+            next_items = next(batches, None)
+            if next_items:
+                fetches = executor.map(fetch_fn, next_items)
+
+            logger.info(
+                "Batch %d completed: %d successful, %d failed out of %d %s",
+                batch_num,
+                successful,
+                failed,
+                len(batch_items),
+                item_label,
+            )
+
+            # Process this batch in the background, then queue the previous one
+            # (processed while this batch was being fetched) for the database
+            future = None
+            if batch_rows:
+                total_rows += len(batch_rows)
+                future = process_pool.submit(process_fn, batch_rows)
+            if pending:
+                _queue_processed_batch(*pending, inserter, stats, dry_run, row_label)
+            pending = (batch_num, future) if future else None
+
+            batch_items = next_items
+            start_idx = end_idx
+
+        if pending:
+            _queue_processed_batch(*pending, inserter, stats, dry_run, row_label)
+
+    logger.info("Total %s fetched: %d", row_label, total_rows)
+    logger.info(
+        "Final summary: %d %s successful, %d failed out of %d total %s",
+        grand_successful,
+        item_label,
+        grand_failed,
+        start_idx,
+        item_label,
+    )
+
+    stats["failed_rows"] = inserter.failed_rows
+    if inserter.failed_batches:
+        logger.error(
+            "%d batches (%d rows) failed to insert into the database",
+            inserter.failed_batches,
+            inserter.failed_rows,
+        )
+
+    return stats
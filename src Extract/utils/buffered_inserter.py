@@ -0,0 +1,72 @@
+import logging
+import threading
+from queue import Queue
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedInserter:
+    """Hands DB inserts to a background thread so fetching continues during commits.
+
+    Each ``submit``-ted list is passed to ``insert_fn`` as one call, in submission
+    order, so upsert batches keep the same boundaries as a synchronous insert. At
+    most ``max_pending`` batches wait in the queue; beyond that ``submit`` blocks,
+    which throttles fetching to the speed of the database. ``close`` waits for
+    every queued batch to be written.
+
+    A failed insert is logged and the remaining batches are still written;
+    callers must check ``failed_batches``/``failed_rows`` after ``close`` to
+    tell whether everything reached the database.
+    """
+
+    def __init__(
+        self,
+        insert_fn: Callable[[List[Dict[str, Any]]], None],
+        name: str = "inserter",
+        max_pending: int = 4,
+    ):
+        self.insert_fn = insert_fn
+        self.name = name
+        self.total_inserted = 0
+        self.failed_batches = 0
+        self.failed_rows = 0
+        self._queue: Queue = Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"BufferedInserter-{name}")
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, rows: List[Dict[str, Any]]) -> None:
+        """Queue a batch of rows for insertion (blocks while the queue is full)"""
+        if rows:
+            self._queue.put(rows)
+
+    def close(self) -> None:
+        """Write every queued batch and stop the background thread"""
+        self._queue.put(None)
+        self._thread.join()
+        logger.info(
+            "%s: inserted %d rows (%d batches / %d rows failed)",
+            self.name,
+            self.total_inserted,
+            self.failed_batches,
+            self.failed_rows,
+        )
+
+    def _run(self) -> None:
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                break
+            try:
+                self.insert_fn(rows)
+                self.total_inserted += len(rows)
+            except Exception as e:
+                self.failed_batches += 1
+                self.failed_rows += len(rows)
+                logger.error("%s: failed to insert batch of %d rows: %s", self.name, len(rows), e)
@@ -0,0 +1,50 @@
+import atexit
+import shelve
+import threading
+from typing import Dict, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content: bytes
+
+
+class ETagCache:
+    """On-disk store of response bodies and their validators for conditional GETs.
+
+    Entries are kept only for responses that carried an ``ETag`` or
+    ``Last-Modified`` header. Access is serialised with a lock so the cache can
+    be shared by worker threads; the shelf is closed at exit. Use
+    ``shared_etag_cache`` rather than opening a path twice in one process.
+    """
+
+    def __init__(self, path: str):
+        self._shelf = shelve.open(path)
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            return self._shelf.get(key)
+
+    def put(self, key: str, etag: Optional[str], last_modified: Optional[str], content: bytes) -> None:
+        with self._lock:
+            self._shelf[key] = CachedResponse(etag, last_modified, content)
+
+    def close(self) -> None:
+        with self._lock:
+            self._shelf.close()
+
+
+_shared_caches: Dict[str, ETagCache] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_etag_cache(path: str) -> ETagCache:
+    """Return the process-wide cache for path, opening it on first use"""
+    with _shared_lock:
+        cache = _shared_caches.get(path)
+        if cache is None:
+            cache = _shared_caches[path] = ETagCache(path)
+        return cache
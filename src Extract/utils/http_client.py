@@ -1,17 +1,29 @@
 import requests
 from requests.adapters import HTTPAdapter, Retry
+from urllib3.util import make_headers
 from config import Config
 
-def get_http_session() -> requests.Session:
+def get_http_session(pool_maxsize: int = 10) -> requests.Session:
     session = requests.Session()
+    # Connection errors, read timeouts and 5xx responses are retried here, below the
+    # Python-level 429 handling in ReidinAPIClient.get (which has per-endpoint retry budgets).
+    # Jitter spreads the retries of parallel workers instead of sending them in lockstep.
     retries = Retry(
         total=Config.RETRIES,
         backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504]
+        backoff_jitter=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    # Keep one reusable keep-alive connection per concurrent worker; connections beyond
+    # pool_maxsize are discarded after use and pay a fresh TCP/TLS handshake next time
+    adapter = HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
 
+    # Offer every encoding urllib3 can decode here: gzip/deflate always, plus br and zstd
+    # when brotli/zstandard are installed (requests' default never offers them)
+    session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
     session.headers.update(Config.get_api_headers())
     return session
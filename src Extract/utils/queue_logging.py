@@ -0,0 +1,66 @@
+import atexit
+import logging
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Iterator
+
+DEFAULT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def configure_queue_logging(
+    handlers: list[logging.Handler],
+    level: int = logging.INFO,
+    fmt: str = DEFAULT_FORMAT,
+) -> QueueListener:
+    """Send root log records through a queue to ``handlers`` on a listener thread.
+
+    Worker threads only enqueue records, so stream and file writes never block
+    them. The listener is stopped (and the queue drained) at interpreter exit.
+    """
+    formatter = logging.Formatter(fmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue: SimpleQueue = SimpleQueue()
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(queue))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class _ReplayHandler(logging.Handler):
+    """Hands a record from a worker process to the logger of the same name in this process"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+@contextmanager
+def forward_worker_logs(mp_context) -> Iterator:
+    """Yield a queue that worker processes log into, replaying their records here.
+
+    Pass the queue to ``init_worker_logging`` as a process pool ``initializer``;
+    the records then reach this process's handlers (and log file) instead of the
+    workers' stderr. Leave this block after the pool has shut down, so every
+    record is replayed.
+    """
+    queue = mp_context.Queue()
+    listener = QueueListener(queue, _ReplayHandler())
+    listener.start()
+    try:
+        yield queue
+    finally:
+        listener.stop()
+
+
+def init_worker_logging(queue, level: int) -> None:
+    """Process pool initializer: send the worker's log records to ``queue``"""
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(queue)]
+    root.setLevel(level)
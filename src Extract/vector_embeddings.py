@@ -136,7 +136,7 @@ class LocationVectorEmbeddings:
                 update_data.append((embedding_vector, item['location_id']))
             
             # Execute batch update
-            with self.db.get_connection() as conn:
+            with self.db.pooled_connection() as conn:
                 with conn.cursor() as cur:
                     cur.executemany(update_query, update_data)
                     conn.commit()
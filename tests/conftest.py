@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The importers are scripts in "src Extract" that import each other by bare module name
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src Extract"))
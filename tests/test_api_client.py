@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+from api_client import ReidinAPIClient, _with_optional
+from config import Config
+from utils.rate_limiter import TokenBucket
+
+
+def test_with_optional_drops_none_and_empty_strings_but_keeps_zero():
+    params = _with_optional({"location_id": 1}, no_of_bedrooms=0, size="", lat=None, lon="55.1")
+    assert params == {"location_id": 1, "no_of_bedrooms": 0, "lon": "55.1"}
+
+
+def test_with_optional_updates_and_returns_the_given_dict():
+    base = {"alias": "last-five"}
+    assert _with_optional(base, lat="25.2") is base
+    assert base == {"alias": "last-five", "lat": "25.2"}
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass  # 304 is not an error for requests either
+
+
+class FakeSession:
+    """Replays canned responses and records the headers of each request"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.sent_headers.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "ETAG_CACHE_PATH", str(tmp_path / "etag_cache"))
+    client = ReidinAPIClient()
+    client.rate_limiter = TokenBucket(rate=0)
+    return client
+
+
+def test_not_modified_response_returns_the_cached_body(client):
+    client.session = FakeSession(
+        FakeResponse(200, b'{"results": [1, 2]}', {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024"}),
+        FakeResponse(304),
+    )
+    params = {"location_id": 7}
+
+    first = client.get("property/location", params, conditional=True)
+    second = client.get("property/location", params, conditional=True)
+
+    assert first == second == {"results": [1, 2]}
+    assert client.session.sent_headers == [
+        None,
+        {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024"},
+    ]
+
+
+def test_responses_without_validators_are_not_cached(client):
+    client.session = FakeSession(
+        FakeResponse(200, b'{"results": []}'),
+        FakeResponse(200, b'{"results": [3]}'),
+    )
+
+    client.get("property/location", {"location_id": 8}, conditional=True)
+    assert client.get("property/location", {"location_id": 8}, conditional=True) == {"results": [3]}
+    assert client.session.sent_headers == [None, None]
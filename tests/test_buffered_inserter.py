@@ -0,0 +1,41 @@
+from utils.buffered_inserter import BufferedInserter
+
+
+def test_batches_are_inserted_in_order_with_their_boundaries():
+    batches = []
+    with BufferedInserter(batches.append, max_pending=1) as inserter:
+        for batch in ([1, 2], [3], [4, 5, 6]):
+            inserter.submit(batch)
+
+    assert batches == [[1, 2], [3], [4, 5, 6]]
+    assert inserter.total_inserted == 6
+    assert (inserter.failed_batches, inserter.failed_rows) == (0, 0)
+
+
+def test_failed_batches_are_counted_and_later_batches_still_written():
+    written = []
+
+    def insert(rows):
+        if "bad" in rows:
+            raise RuntimeError("constraint violation")
+        written.extend(rows)
+
+    with BufferedInserter(insert) as inserter:
+        inserter.submit(["a", "b"])
+        inserter.submit(["bad", "c", "d"])
+        inserter.submit(["e"])
+        inserter.submit(["bad"])
+
+    assert written == ["a", "b", "e"]
+    assert inserter.total_inserted == 3
+    assert inserter.failed_batches == 2
+    assert inserter.failed_rows == 4
+
+
+def test_empty_batches_are_not_inserted():
+    calls = []
+    with BufferedInserter(calls.append) as inserter:
+        inserter.submit([])
+
+    assert calls == []
+    assert inserter.total_inserted == 0
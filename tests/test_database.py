@@ -0,0 +1,175 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("dotenv")
+
+import psycopg2.extras
+
+import database
+from database import DatabaseManager
+from processors import CMASalesRecord
+
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def upserted(monkeypatch):
+    """Run insert_transactions_avg_data without a database; collects the rows sent to execute_values"""
+    rows = []
+
+    @contextmanager
+    def pooled_connection():
+        yield type("FakeConnection", (), {"cursor": lambda self: FakeCursor()})()
+
+    def execute_values(cur, query, data, page_size=100):
+        rows.extend(data)
+
+    db = DatabaseManager()
+    monkeypatch.setattr(db, "pooled_connection", pooled_connection)
+    monkeypatch.setattr(database, "execute_values", execute_values)
+    return db, rows
+
+
+def avg_record(**overrides):
+    record = {
+        "location_id": 1,
+        "location_name": "Downtown",
+        "property_type": "Apartment",
+        "activity_type": "sales",
+        "currency": "aed",
+        "measurement": "int",
+        "no_of_bedrooms": 2,
+        "date_period": "2024-01",
+        "average_net_price": 100,
+    }
+    record.update(overrides)
+    return record
+
+
+def test_duplicate_conflict_keys_keep_the_last_record(upserted):
+    db, rows = upserted
+    db.insert_transactions_avg_data([
+        avg_record(average_net_price=100),
+        avg_record(date_period="2024-02"),
+        # location_name is not part of the conflict key
+        avg_record(average_net_price=200, location_name="Renamed"),
+    ])
+
+    assert len(rows) == 2
+    first = dict(zip(("location_id", "location_name"), rows[0][:2]))
+    assert first == {"location_id": 1, "location_name": "Renamed"}
+    assert rows[0][10] == 200
+    assert rows[1][7] == "2024-02"
+
+
+def test_rows_with_null_key_columns_are_not_merged(upserted):
+    # NULLs never conflict under the UNIQUE constraint, so both rows are inserted
+    db, rows = upserted
+    db.insert_transactions_avg_data([
+        avg_record(no_of_bedrooms=None, average_net_price=100),
+        avg_record(no_of_bedrooms=None, average_net_price=200),
+    ])
+
+    assert [row[10] for row in rows] == [100, 200]
+
+
+class KeysetCursor(FakeCursor):
+    """Serves `... [WHERE key > %s] ORDER BY key LIMIT %s` pages from a sorted list of keys"""
+
+    def __init__(self, key, keys, executed):
+        self.description = [(key,)]
+        self.key = key
+        self.keys = keys
+        self.executed = executed
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+        after = params[-2] if f"{self.key} > %s" in query else None
+        self.rows = [(k,) for k in self.keys if after is None or k > after][:params[-1]]
+
+    def fetchall(self):
+        return self.rows
+
+
+def keyset_db(monkeypatch, key, keys):
+    executed = []
+
+    @contextmanager
+    def pooled_connection():
+        yield type("FakeConnection", (), {"cursor": lambda self: KeysetCursor(key, keys, executed)})()
+
+    db = DatabaseManager()
+    monkeypatch.setattr(db, "pooled_connection", pooled_connection)
+    return db, executed
+
+
+def test_iter_keyset_pages_after_the_last_key(monkeypatch):
+    db, executed = keyset_db(monkeypatch, "id", [2, 3, 5, 7, 11, 13, 17])
+
+    assert [row["id"] for row in db.iter_properties(page_size=3)] == [2, 3, 5, 7, 11, 13, 17]
+    # A short page ends the stream without another query
+    assert [params for _, params in executed] == [[3], [5, 3], [13, 3]]
+    assert "WHERE" not in executed[0][0]
+    assert executed[1][0] == "SELECT id FROM property WHERE id > %s ORDER BY id LIMIT %s"
+
+
+def test_iter_keyset_applies_limit_across_pages(monkeypatch):
+    db, executed = keyset_db(monkeypatch, "location_id", list(range(1, 20)))
+
+    rows = list(db.iter_locations("ae", limit=5, page_size=3))
+
+    assert [row["location_id"] for row in rows] == [1, 2, 3, 4, 5]
+    # The last page only asks for what the limit leaves, and no query follows it
+    assert [params for _, params in executed] == [["ae", 3], ["ae", 3, 2]]
+    assert "WHERE country_code = %s AND location_id > %s" in executed[1][0]
+
+
+def insert_columns(sql):
+    return re.search(r"INSERT INTO cma_sales \(([^)]*)\)", sql).group(1).replace(",", " ").split()
+
+
+def test_cma_sales_record_matches_execute_values_columns(monkeypatch):
+    queries = []
+
+    @contextmanager
+    def pooled_connection():
+        yield type("FakeConnection", (), {"cursor": lambda self: FakeCursor()})()
+
+    db = DatabaseManager()
+    monkeypatch.setattr(db, "pooled_connection", pooled_connection)
+    monkeypatch.setattr(psycopg2.extras, "execute_values", lambda cur, query, data, page_size: queries.append(query))
+    db.insert_cma_sales_data([CMASalesRecord(*range(len(CMASalesRecord._fields)))])
+
+    assert insert_columns(queries[0]) == list(CMASalesRecord._fields)
+    # insert_cma_sales_data wraps the last two fields as JSONB by position
+    assert CMASalesRecord._fields[26:] == ("parent_property", "raw_data")
+
+
+def test_cma_sales_record_matches_copy_columns(monkeypatch):
+    statements = []
+
+    class CopyCursor(FakeCursor):
+        def execute(self, sql):
+            statements.append(sql)
+
+        def copy_expert(self, sql, file):
+            statements.append(sql)
+
+    connection = type("FakeConnection", (), {"cursor": lambda self: CopyCursor(), "commit": lambda self: None})()
+    db = DatabaseManager()
+    monkeypatch.setattr(db, "get_connection", lambda: connection)
+    monkeypatch.setattr(db, "return_connection", lambda conn: None)
+    db._bulk_insert_with_copy([CMASalesRecord(*range(len(CMASalesRecord._fields)))])
+
+    copy_columns = re.search(r"COPY cma_sales_staging \(([^)]*)\)", statements[1]).group(1)
+    assert copy_columns.split(", ") == list(CMASalesRecord._fields)
+    assert insert_columns(statements[2]) == list(CMASalesRecord._fields)
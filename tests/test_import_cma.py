@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+from import_cma import CMAImporter, ColumnBuffer
+from utils import fast_json
+
+
+def flatten_recursive(data, prefix=""):
+    """The original recursive _flatten_data, kept as the reference behaviour"""
+    flattened = {}
+    for key, value in data.items():
+        column_name = f"{prefix}_{key}" if prefix else key
+        if isinstance(value, dict):
+            flattened.update(flatten_recursive(value, column_name))
+        elif isinstance(value, list):
+            if value and isinstance(value[0], dict):
+                for i, item in enumerate(value):
+                    flattened.update(flatten_recursive(item, f"{column_name}_{i}"))
+            else:
+                flattened[column_name] = fast_json.dumps(value) if value else None
+        else:
+            flattened[column_name] = value
+    return flattened
+
+
+@pytest.fixture
+def importer():
+    # _flatten_data uses no instance state; skip __init__, which opens DB/API clients
+    return CMAImporter.__new__(CMAImporter)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"id": 1, "name": "x", "price": None},
+        {"a": {"b": {"c": 1, "d": [1, 2]}, "e": "f"}, "g": 2},
+        {"comps": [{"id": 1, "geo": {"lat": 25.1}}, {"id": 2, "tags": []}], "empty": []},
+        {"outer": [{"inner": [{"x": 1}, {"x": 2, "y": {"z": True}}]}], "after": "kept"},
+    ],
+)
+def test_flatten_data_matches_recursive_version(importer, data):
+    assert importer._flatten_data(data) == flatten_recursive(data)
+
+
+def test_flatten_data_uses_prefix(importer):
+    data = {"a": {"b": 1}}
+    assert importer._flatten_data(data, "cma") == flatten_recursive(data, "cma") == {"cma_a_b": 1}
+
+
+def test_column_buffer_keeps_columns_aligned():
+    buffer = ColumnBuffer()
+    buffer.extend([{"a": 1, "b": 2}, {"b": 3, "c": 4}, {"a": 5}])
+
+    assert len(buffer) == 3
+    assert buffer.columns == {
+        "a": [1, None, 5],
+        "b": [2, 3, None],
+        "c": [None, 4, None],
+    }
+
+
+def test_column_buffer_clear():
+    buffer = ColumnBuffer()
+    buffer.append({"a": 1})
+    buffer.clear()
+    buffer.append({"b": 2})
+
+    assert len(buffer) == 1
+    assert buffer.columns == {"b": [2]}
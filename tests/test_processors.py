@@ -0,0 +1,38 @@
+from processors import DataProcessor
+
+
+def cma_sales(raw_data, property_subtype):
+    return DataProcessor.process_cma_sales_data(
+        raw_data, 1, "last-five", "aed", "int", "Residential", property_subtype
+    )
+
+
+def test_cma_sales_dedup_on_comparable_id_within_one_subtype():
+    records = cma_sales(
+        [
+            {"property_id": 10, "price": 100},
+            {"property_id": 10, "price": 200},
+            {"property_id": 11, "price": 300},
+        ],
+        "Apartment",
+    )
+
+    assert [(r.comparable_property_id, r.price) for r in records] == [(10, 100), (11, 300)]
+    assert {r.property_subtype for r in records} == {"Apartment"}
+
+
+def test_cma_sales_keeps_a_comparable_listed_under_two_subtypes():
+    # Combined subtype requests take each record's own subtype, which is part of the unique key
+    records = cma_sales(
+        [
+            {"property_id": 10, "property_subtype": "Apartment"},
+            {"property_id": 10, "property_subtype": "Villa"},
+            {"property_id": 10, "property_subtype": "Villa"},
+        ],
+        None,
+    )
+
+    assert [(r.property_subtype, r.comparable_property_id) for r in records] == [
+        ("Apartment", 10),
+        ("Villa", 10),
+    ]
@@ -0,0 +1,60 @@
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import TokenBucket
+
+
+class FakeClock:
+    """Stands in for the time module: sleep advances monotonic instead of blocking"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def test_burst_is_served_without_waiting(clock):
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_waits_once_burst_is_spent(clock):
+    bucket = TokenBucket(rate=2.0, capacity=1)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_tokens_refill_over_time_up_to_capacity(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    # Ten idle seconds refill only up to capacity
+    clock.now += 10
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_zero_rate_never_waits(clock):
+    bucket = TokenBucket(rate=0)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.sleeps == []